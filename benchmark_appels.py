@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-banc du coût d'un appel au pilote, pour les écritures et lectures de registres du chemin de configuration.
+
+Chaque variante est appelée en boucle et la durée rapportée est celle d'un appel :
+- sans_prototype : fonction du pilote sans argtypes, comme pyspcm les déclarait avant (conversion ctypes implicite) ;
+- prototype : fonction de pyspcm, arguments convertis selon argtypes ;
+- lie : AppelsCarte, handle et fonction liés d'avance, variable de lecture réutilisée ;
+- cache : écriture d'une valeur inchangée à travers RegisterCache.
+Sans pilote installé, les variantes ctypes sont mesurées sur memset de la libc, déclaré avec le prototype de
+spcm_dwSetParam_i64 (handle, entier 32 bits, entier 64 bits) et appelé sur 0 octet : seul le coût de l'appel ctypes
+est mesuré. Les variantes du backend sont mesurées sur la carte simulée, ou sur la netbox avec --backend pilote.
+Résultats en JSON lines.
+
+Exemples :
+    python benchmark_appels.py
+    python benchmark_appels.py --backend pilote --ip 169.254.114.9
+"""
+import argparse
+import ctypes.util
+import json
+import os
+import platform
+import sys
+import time
+from functools import partial
+from typing import Callable, Dict, List
+
+import numpy as np
+
+import netbox_api
+from netbox_api import *
+
+
+def mesurer_appels(fonction: Callable, n_appels: int, repetitions: int) -> List[float]:
+    """
+    Durée (s) d'un appel à fonction, moyennée sur n_appels appels, pour chacune des répétitions.
+    """
+    boucle = range(n_appels)
+    for _ in boucle:
+        fonction()
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        for _ in boucle:
+            fonction()
+        durees.append((time.perf_counter() - debut) / n_appels)
+    return durees
+
+
+def resume_us(durees: List[float]) -> Dict[str, float]:
+    """
+    Statistiques d'une série de durées, en microsecondes.
+    """
+    durees = np.asarray(durees) * 1e6
+    return {"n": int(durees.size), "min_us": float(durees.min()), "mediane_us": float(np.median(durees)),
+            "moyenne_us": float(durees.mean())}
+
+
+def variantes_ctypes() -> Dict[str, Callable]:
+    """
+    Appels ctypes seuls : le pilote s'il est chargé, memset de la libc sinon.
+    """
+    if pyspcm.bDriverLoaded:
+        return {}
+    libc = ctypes.cdll.msvcrt if os.name == "nt" else ctypes.CDLL(ctypes.util.find_library("c"))
+    # le tampon joue le rôle du handle : même type que celui renvoyé par spcm_hOpen
+    tampon = drv_handle(uint64(0))
+    sans_prototype = libc["memset"]
+    prototype = libc["memset"]
+    prototype.argtypes = [drv_handle, int32, int64]
+    prototype.restype = uint32
+    return {
+        "sans_prototype": lambda: sans_prototype(tampon, 0, 0),
+        "prototype": lambda: prototype(tampon, 0, 0),
+        "lie": partial(prototype, tampon, 0, 0),
+    }
+
+
+def variantes_backend(hcard, backend) -> Dict[str, Callable]:
+    """
+    Écriture de SPC_TIMEOUT et lecture de SPC_PCITYP sur la carte ouverte, selon chaque variante.
+    """
+    appels = AppelsCarte(hcard, backend)
+    cache = RegisterCache(backend)
+    valeur = appels.lire_i32(SPC_TIMEOUT)
+    cache.spcm_dwSetParam_i32(hcard, SPC_TIMEOUT, valeur)
+    variantes = {
+        "ecriture_prototype": lambda: backend.spcm_dwSetParam_i32(hcard, SPC_TIMEOUT, valeur),
+        "ecriture_lie": lambda: appels.ecrire_i32(SPC_TIMEOUT, valeur),
+        "ecriture_cache": lambda: cache.spcm_dwSetParam_i32(hcard, SPC_TIMEOUT, valeur),
+        "lecture_prototype": lambda: backend.spcm_dwGetParam_i64(hcard, SPC_PCITYP, byref(int64(0))),
+        "lecture_lie": lambda: appels.lire_i64(SPC_PCITYP),
+    }
+    if backend is pyspcm and pyspcm.bDriverLoaded:
+        # même fonction du pilote, sans argtypes (spcmDll[...] renvoie un nouvel objet fonction)
+        sans_prototype = pyspcm.spcmDll[pyspcm._sExportName("spcm_dwSetParam_i32", [drv_handle, int32, int32])]
+        sans_prototype.restype = uint32
+        variantes["ecriture_sans_prototype"] = lambda: sans_prototype(hcard, SPC_TIMEOUT, valeur)
+    return variantes
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", choices=("simule", "pilote"), default="simule")
+    parser.add_argument("--ip", default="169.254.114.9")
+    parser.add_argument("--card-number", type=int, default=0)
+    parser.add_argument("--latence", type=float, default=0.0, help="latence par appel de la carte simulée (s)")
+    parser.add_argument("--appels", type=int, default=10000, help="appels par répétition (ctypes et carte simulée)")
+    parser.add_argument("--appels-pilote", type=int, default=100, help="appels par répétition sur la netbox")
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--sortie", help="fichier JSON lines de résultats (sortie standard par défaut)")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.backend == "simule":
+        from spcm_simule import CarteSimulee
+        backend = CarteSimulee(latence=arguments.latence, journal_max=0)
+        n_appels = arguments.appels
+    else:
+        backend = pyspcm
+        n_appels = arguments.appels_pilote
+    netbox_api.choisir_backend(backend)
+
+    contexte = {"backend": arguments.backend, "python": platform.python_version(), "machine": platform.machine(),
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    resultats = []
+    for variante, fonction in variantes_ctypes().items():
+        durees = mesurer_appels(fonction, arguments.appels, arguments.repetitions)
+        resultats.append(dict(contexte, appel="memset", variante=variante, **resume_us(durees)))
+
+    hcard = ouverture_carte(arguments.ip, arguments.card_number, backend=backend)
+    try:
+        for variante, fonction in variantes_backend(hcard, backend).items():
+            durees = mesurer_appels(fonction, n_appels, arguments.repetitions)
+            resultats.append(dict(contexte, appel="pilote", variante=variante, **resume_us(durees)))
+    finally:
+        fermeture_carte(hcard, backend=backend)
+
+    sortie = open(arguments.sortie, "w", encoding="utf-8") if arguments.sortie else sys.stdout
+    try:
+        for resultat in resultats:
+            sortie.write(json.dumps(resultat) + "\n")
+    finally:
+        if sortie is not sys.stdout:
+            sortie.close()
+    return resultats
+
+
+if __name__ == "__main__":
+    main()
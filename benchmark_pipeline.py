@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Banc de mesure du chemin de MainFrame.start_signaux, du changement de paramètres à la sortie de la carte.
+
+Chaque étape (obtention_sinus_analogique, process_buffer, init_canaux, transfert_netbox, start) est chronométrée
+séparément pour plusieurs tailles de buffer et nombres de voies, sur la carte simulée ou sur la netbox. maj_figures,
+qui dépend de l'interface (4 voies, 65536 échantillons), est mesurée en plus avec --gui quand un affichage est
+disponible. Les résultats sont écrits en JSON, une ligne par étape et par configuration, pour être comparés d'une
+version à l'autre, suivis d'une ligne "appel" par fonction du pilote et par registre (PiloteVerifie).
+
+Exemples :
+    python benchmark_pipeline.py --backend simule --tailles 16384 65536 262144 --voies 1 2 4
+    python benchmark_pipeline.py --backend pilote --ip 169.254.114.9 --sortie mesures.jsonl
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+import netbox_api
+from netbox_api import *
+from synthese_signaux import synthese_entrelacee, synthese_voies
+
+
+def mesurer(fonction: Callable, repetitions: int, echauffement: int = 1) -> List[float]:
+    """
+    Durées (s) de `repetitions` appels à fonction, après `echauffement` appels non comptés (caches, allocations).
+    """
+    for _ in range(echauffement):
+        fonction()
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return durees
+
+
+def resume(durees: List[float]) -> Dict[str, float]:
+    """
+    Statistiques d'une série de durées, en millisecondes.
+    """
+    durees = np.asarray(durees) * 1e3
+    return {"n": int(durees.size), "min_ms": float(durees.min()), "mediane_ms": float(np.median(durees)),
+            "p90_ms": float(np.percentile(durees, 90)), "moyenne_ms": float(durees.mean())}
+
+
+def masque_voies(n_voies: int) -> int:
+    # voies 0 à n_voies - 1 (CHANNEL0 | CHANNEL1 ...)
+    return (1 << n_voies) - 1
+
+
+def mesure_configuration(hcard, backend, taille_buffer: int, n_voies: int, repetitions: int,
+                         freq_rf=75e6, facteur_correction=1.6) -> Dict[str, List[float]]:
+    """
+    Chronomètre les étapes matérielles et de synthèse pour une taille de buffer (échantillons par voie) et un nombre
+    de voies.
+    """
+    ponderations = np.ones(n_voies)
+    phases_radians = np.linspace(0, np.pi, n_voies)
+    channels = masque_voies(n_voies)
+    taille_dma = taille_buffer * n_voies * 2
+    pv_buffer = init_buffer(hcard, taille_dma, backend=backend)
+    pn_buffer = vue_buffer_int16(pv_buffer, taille_dma)
+
+    def demarrage():
+        start(hcard, timeout=True, timeout_duration=10000, backend=backend)
+        stop(hcard, backend=backend)
+
+    return {
+        "obtention_sinus_analogique": mesurer(lambda: synthese_voies(freq_rf, ponderations, phases_radians,
+                                                                      facteur_correction, taille_buffer),
+                                              repetitions),
+        "process_buffer": mesurer(lambda: synthese_entrelacee(pn_buffer, freq_rf, ponderations, phases_radians,
+                                                              facteur_correction), repetitions),
+        # init_canaux règle SPC_MEMSIZE sur la taille testée, avant les mesures de transfert et de démarrage
+        "init_canaux": mesurer(lambda: init_canaux(hcard, channels, memsize=taille_buffer, backend=backend),
+                               repetitions),
+        "transfert_netbox": mesurer(lambda: transfert_netbox(hcard, pv_buffer, taille_dma, backend=backend),
+                                    repetitions),
+        "start": mesurer(demarrage, repetitions),
+    }
+
+
+def mesure_maj_figures(repetitions: int) -> Optional[List[float]]:
+    """
+    Chronomètre MainFrame.maj_figures dans une fenêtre Tk non affichée.
+    :return: None si aucun affichage n'est disponible.
+    """
+    import tkinter as tk
+    chemin = os.path.join(os.path.dirname(os.path.abspath(__file__)), "projet indus.py")
+    spec = importlib.util.spec_from_file_location("projet_indus", chemin)
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+        fenetre = tk.Tk()
+    except (ImportError, tk.TclError) as erreur:
+        sys.stderr.write(f"maj_figures non mesurée, pas d'affichage: {erreur}\n")
+        return None
+    fenetre.withdraw()
+    try:
+        main_frame = module.MainFrame(fenetre)
+        return mesurer(main_frame.maj_figures, repetitions)
+    finally:
+        fenetre.destroy()
+
+
+def mesures_materiel(arguments, backend, enregistrer):
+    # carte ouverte et configurée une fois, puis chaque configuration (voies, taille de buffer) est mesurée
+    hcard = ouverture_carte(arguments.ip, arguments.card_number, backend=backend)
+    try:
+        card_type = check_card(hcard, backend=backend)
+        init_vitesse_sampling(card_type, hcard, backend=backend)
+        backend.spcm_dwSetParam_i32(hcard, SPC_CARDMODE, SPC_REP_STD_CONTINUOUS)
+        backend.spcm_dwSetParam_i64(hcard, SPC_LOOPS, 0)
+        init_trigger(hcard, backend=backend)
+        for n_voies in arguments.voies:
+            for taille_buffer in arguments.tailles:
+                mesures = mesure_configuration(hcard, backend, taille_buffer, n_voies, arguments.repetitions)
+                for etape, durees in mesures.items():
+                    enregistrer(etape, durees, taille_buffer=taille_buffer, voies=n_voies)
+    finally:
+        fermeture_carte(hcard, backend=backend)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", choices=("simule", "pilote"), default="simule")
+    parser.add_argument("--ip", default="169.254.114.9")
+    parser.add_argument("--card-number", type=int, default=0)
+    parser.add_argument("--latence", type=float, default=0.0005, help="latence par appel de la carte simulée (s)")
+    parser.add_argument("--debit", type=float, default=100e6, help="débit DMA de la carte simulée (octets/s)")
+    parser.add_argument("--tailles", type=int, nargs="+", default=[16384, 65536, 262144],
+                        help="échantillons par voie")
+    parser.add_argument("--voies", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--gui", action="store_true", help="mesure aussi maj_figures (nécessite un affichage)")
+    parser.add_argument("--sortie", help="fichier JSON lines de résultats (sortie standard par défaut)")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.backend == "simule":
+        from spcm_simule import CarteSimulee
+        backend = CarteSimulee(latence=arguments.latence, debit=arguments.debit, captures_max=1)
+    else:
+        backend = pyspcm
+    netbox_api.choisir_backend(backend)
+
+    contexte = {"backend": arguments.backend, "python": platform.python_version(), "numpy": np.__version__,
+                "machine": platform.machine(), "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    resultats = []
+
+    def enregistrer(etape, durees, **configuration):
+        resultats.append(dict(contexte, etape=etape, **configuration, **resume(durees)))
+
+    # durée de chaque appel au pilote, par registre : une ligne "appel" par fonction et registre dans les résultats
+    verifie = PiloteVerifie(backend, lever=False)
+    # les messages du pilote et de netbox_api partent sur stderr, stdout ne reçoit que les résultats
+    with contextlib.redirect_stdout(sys.stderr):
+        mesures_materiel(arguments, verifie, enregistrer)
+        durees = mesure_maj_figures(arguments.repetitions) if arguments.gui else None
+        if durees is not None:
+            enregistrer("maj_figures", durees, taille_buffer=65536, voies=4)
+
+    resultats.extend(dict(contexte, etape="appel", **ligne) for ligne in verifie.statistiques())
+    for erreur in verifie.erreurs:
+        sys.stderr.write(f"erreur du pilote: {erreur}\n")
+
+    sortie = open(arguments.sortie, "w", encoding="utf-8") if arguments.sortie else sys.stdout
+    try:
+        for resultat in resultats:
+            sortie.write(json.dumps(resultat) + "\n")
+    finally:
+        if sortie is not sys.stdout:
+            sortie.close()
+    return resultats
+
+
+if __name__ == "__main__":
+    main()
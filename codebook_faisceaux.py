@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Codebook de faisceaux : buffers DMA précalculés pour une grille d'angles de dépointage.
+
+Chaque ligne du codebook est le buffer entrelacé int16 prêt à être transféré sur la carte pour un angle donné. Le
+codebook est stocké sur disque dans un dossier (buffers.npy, angles.npy, parametres.json) et relu en mémoire projetée :
+changer de cible revient alors à copier une ligne dans le buffer DMA puis à lancer le transfert, sans synthèse.
+"""
+import json
+import os
+from typing import Callable, Sequence
+
+import numpy as np
+
+from synthese_signaux import TAILLE_BUFFER, synthese_entrelacee
+
+
+def pas_de_phase_pour_angle(angle_radians: float, distance_element: float, lmbda: float) -> float:
+    """
+    Pas de phase entre deux éléments voisins pour dépointer le faisceau de l'angle demandé. C'est la relation inverse
+    de celle utilisée pour afficher le dépointage réalisé (calcul_phase_secteur_angulaire).
+    :param angle_radians: angle de dépointage (radians).
+    :param distance_element: distance inter-éléments dans le réseau (en m)
+    :param lmbda: longueur d'onde (en m)
+    :return: pas de phase (radians)
+    """
+    return -2 * np.pi * distance_element / lmbda * np.sin(angle_radians)
+
+
+def phases_voies(pas_de_phase_radians: float, n_voies: int = 4) -> np.ndarray:
+    """
+    Phase de chaque voie pour un pas de phase donné, comme dans l'interface : la voie k reçoit k fois le pas.
+    :param pas_de_phase_radians: pas de phase (radians).
+    :param n_voies: nombre de voies.
+    :return: np.array
+    """
+    return (np.arange(n_voies) * pas_de_phase_radians) % (2 * np.pi)
+
+
+class CodebookFaisceaux:
+    """
+    Codebook ouvert en mémoire projetée. Les buffers ne sont lus depuis le disque qu'au moment où ils sont copiés.
+    """
+    FICHIER_BUFFERS = "buffers.npy"
+    FICHIER_ANGLES = "angles.npy"
+    FICHIER_PARAMETRES = "parametres.json"
+
+    def __init__(self, chemin: str) -> None:
+        """
+        :param chemin: dossier du codebook, créé par construire_codebook.
+        """
+        self.chemin = chemin
+        self.buffers = np.load(os.path.join(chemin, self.FICHIER_BUFFERS), mmap_mode="r")
+        self.angles_radians = np.load(os.path.join(chemin, self.FICHIER_ANGLES))
+        with open(os.path.join(chemin, self.FICHIER_PARAMETRES), encoding="utf-8") as fichier:
+            self.parametres = json.load(fichier)
+
+    def __len__(self) -> int:
+        return len(self.angles_radians)
+
+    @property
+    def taille_buffer(self) -> int:
+        """
+        Taille d'un buffer en octets.
+        """
+        return self.buffers.shape[1] * self.buffers.itemsize
+
+    def indice(self, angle_radians: float) -> int:
+        """
+        Indice de l'angle de la grille le plus proche de l'angle demandé.
+        """
+        return int(np.abs(self.angles_radians - angle_radians).argmin())
+
+    def buffer(self, angle_radians: float) -> np.ndarray:
+        """
+        Buffer entrelacé (vue en lecture seule) de l'angle de la grille le plus proche.
+        """
+        return self.buffers[self.indice(angle_radians)]
+
+    def copier(self, angle_radians: float, destination: np.ndarray) -> float:
+        """
+        Copie le buffer de l'angle le plus proche dans le buffer de destination (typiquement la vue sur le buffer DMA).
+        :return: l'angle de la grille effectivement utilisé (radians).
+        """
+        indice = self.indice(angle_radians)
+        np.copyto(destination[:self.buffers.shape[1]], self.buffers[indice])
+        return float(self.angles_radians[indice])
+
+    def remplissage(self, angle_radians: float) -> Callable:
+        """
+        Fonction de remplissage à passer à CardSession.transferer pour émettre le faisceau demandé.
+        """
+        from netbox_api import vue_buffer_int16
+
+        def remplir(pv_buffer, taille_buffer):
+            self.copier(angle_radians, vue_buffer_int16(pv_buffer, taille_buffer))
+
+        return remplir
+
+
+def construire_codebook(chemin: str, angles_radians: Sequence[float], distance_element: float, lmbda: float,
+                        freq_rf: float, ponderations: Sequence[float] = (1, 1, 1, 1), facteur_correction: float = 1.6,
+                        taille_buffer: int = TAILLE_BUFFER) -> CodebookFaisceaux:
+    """
+    Précalcule les buffers de tous les angles de la grille et les écrit sur disque.
+    :param chemin: dossier de destination (créé si besoin).
+    :param angles_radians: grille d'angles de dépointage (radians).
+    :param distance_element: distance inter-éléments dans le réseau (en m)
+    :param lmbda: longueur d'onde (en m)
+    :param freq_rf: fréquence RF des signaux (Hz).
+    :param ponderations: pondération de chaque voie.
+    :param facteur_correction: rapport entre la fréquence d'échantillonnage théorique et celle de la netbox.
+    :param taille_buffer: nombre d'échantillons par voie.
+    :return: CodebookFaisceaux
+    """
+    os.makedirs(chemin, exist_ok=True)
+    angles_radians = np.asarray(angles_radians, dtype=np.float64)
+    n_voies = len(ponderations)
+    buffers = np.lib.format.open_memmap(os.path.join(chemin, CodebookFaisceaux.FICHIER_BUFFERS), mode="w+",
+                                        dtype=np.int16, shape=(len(angles_radians), taille_buffer * n_voies))
+    for ligne, angle in zip(buffers, angles_radians):
+        phases = phases_voies(pas_de_phase_pour_angle(angle, distance_element, lmbda), n_voies)
+        synthese_entrelacee(ligne, freq_rf, ponderations, phases, facteur_correction)
+    buffers.flush()
+    del buffers
+    np.save(os.path.join(chemin, CodebookFaisceaux.FICHIER_ANGLES), angles_radians)
+    with open(os.path.join(chemin, CodebookFaisceaux.FICHIER_PARAMETRES), "w", encoding="utf-8") as fichier:
+        json.dump({"distance_element": distance_element, "lmbda": lmbda, "freq_rf": freq_rf,
+                   "ponderations": list(ponderations), "facteur_correction": facteur_correction,
+                   "taille_buffer": taille_buffer}, fichier, indent=2)
+    return CodebookFaisceaux(chemin)
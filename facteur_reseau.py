@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur de calcul du facteur de réseau.
+
+Les facteurs de réseau de nombreuses configurations (pondérations complexes des éléments) sont évalués en une seule
+fois : la matrice de propagation exp(j * n * psi) est construite une fois pour la grille d'angles, puis multipliée par
+la matrice des poids (configurations x éléments). Le résultat (configurations x angles) est obtenu par un seul produit
+matriciel, en double ou en simple précision.
+
+Les configurations à amplitudes égales et phase linéaire (réseau uniforme, éventuellement dépointé) n'ont pas besoin
+de cette somme : leur facteur de réseau a la forme fermée |sin(N psi / 2) / (N sin(psi / 2))|, évaluée en O(angles)
+quel que soit le nombre d'éléments. Les réseaux planaires à pondération séparable se ramènent au produit de deux
+facteurs linéaires. Pour des poids quelconques sur des grilles denses, le diagramme est calculé par une FFT complétée
+de zéros sur une grille uniforme de psi (facteur_reseau_fft), puis interpolé sur les psi ou les theta demandés
+(facteur_reseau_interpole, facteur_reseau_theta) : O(M log M) au lieu de O(éléments x angles).
+"""
+from typing import Sequence
+
+import numpy as np
+
+# méthode "auto" : passage par la FFT pour des poids quelconques à partir de ce nombre d'éléments, si la grille
+# compte au moins SEUIL_FFT_POINTS_PAR_ELEMENT angles par élément
+SEUIL_FFT_ELEMENTS = 16
+SEUIL_FFT_POINTS_PAR_ELEMENT = 64
+# méthode "auto" : coûts par point (configuration x angle) de la forme fermée et, par élément, de la construction de
+# la matrice de propagation, en multiplications-additions du produit matriciel ; la forme fermée coûte quelques
+# fonctions trigonométriques par point, le produit matriciel n'en calcule que pour la matrice, partagée par le lot
+COUT_FORME_FERMEE = 400
+COUT_PROPAGATION = 300
+# même unité : coût par point de la grille FFT et par configuration (FFT, recentrage et interpolation) ; la FFT ne
+# vaut que pour quelques configurations, tant qu'elle évite la construction de la matrice de propagation
+COUT_FFT = 500
+# points de la grille FFT par élément : l'erreur d'interpolation reste sous 1e-4 du maximum
+SURECHANTILLONNAGE_FFT = 256
+
+
+def psi_depuis_theta(theta: np.ndarray, distance_element: float, lmbda: float,
+                     pas_de_phase_radians: float = 0) -> np.ndarray:
+    """
+    Déphasage entre deux éléments voisins pour chaque direction d'observation.
+    :param theta: directions d'observation (radians).
+    :param distance_element: distance inter-éléments dans le réseau (en m)
+    :param lmbda: longueur d'onde (en m)
+    :param pas_de_phase_radians: pas de phase appliqué entre deux éléments (radians).
+    :return: np.array
+    """
+    return pas_de_phase_radians + 2 * np.pi * distance_element / lmbda * np.sin(theta)
+
+
+def matrice_propagation(psi: np.ndarray, n_elem: int, dtype=np.complex128) -> np.ndarray:
+    """
+    Matrice exp(j * n * psi) de forme (éléments, angles).
+    :param psi: déphasages entre éléments voisins (radians).
+    :param n_elem: nombre d'éléments du réseau.
+    :param dtype: np.complex128 ou np.complex64.
+    :return: np.array
+    """
+    reel = np.float32 if dtype == np.complex64 else np.float64
+    phases = np.outer(np.arange(n_elem, dtype=reel), np.asarray(psi, dtype=reel))
+    return np.exp(1j * phases).astype(dtype, copy=False)
+
+
+def poids_depointage(pas_de_phase_radians: Sequence[float], amplitudes: Sequence[float]) -> np.ndarray:
+    """
+    Poids complexes a_n * exp(j * n * pas) pour une série de pas de phase.
+    :param pas_de_phase_radians: pas de phase de chaque configuration (radians).
+    :param amplitudes: amplitude de chaque élément, commune à toutes les configurations.
+    :return: np.array de forme (configurations, éléments)
+    """
+    amplitudes = np.asarray(amplitudes, dtype=np.float64)
+    n = np.arange(len(amplitudes))
+    return amplitudes * np.exp(1j * np.outer(np.atleast_1d(pas_de_phase_radians), n))
+
+
+def pas_lineaires(poids: np.ndarray, tolerance: float = 1e-9):
+    """
+    Repère, en une passe sur tout le lot, les configurations de la forme a * exp(j * n * d) (amplitudes égales, phase
+    linéaire) et leur pas de phase d.
+    :param poids: poids des éléments, de forme (configurations, éléments).
+    :param tolerance: tolérance relative des comparaisons.
+    :return: (masque des configurations uniformes de forme (configurations,), pas d (radians) de chacune, sans
+        signification pour les autres)
+    """
+    poids = np.atleast_2d(np.asarray(poids))
+    n_config, n_elem = poids.shape
+    if n_elem == 0:
+        return np.zeros(n_config, dtype=bool), np.zeros(n_config)
+    module = np.abs(poids)
+    reference = module[:, :1]
+    uniformes = (reference[:, 0] != 0) & np.all(np.abs(module - reference) <= tolerance * reference, axis=1)
+    if n_elem == 1:
+        return uniformes, np.zeros(n_config)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rapports = poids[:, 1:] / poids[:, :-1]
+    uniformes &= np.all(np.abs(rapports - rapports[:, :1]) <= tolerance, axis=1)
+    return uniformes, np.angle(rapports[:, 0]).astype(np.float64)
+
+
+def pas_lineaire(poids: Sequence[complex], tolerance: float = 1e-9):
+    """
+    Pas de phase d si les poids sont de la forme a * exp(j * n * d) (amplitudes égales, phase linéaire).
+    :param poids: poids des éléments, de forme (éléments,).
+    :param tolerance: tolérance relative des comparaisons.
+    :return: d (radians), ou None si les poids n'ont pas cette forme.
+    """
+    uniformes, pas = pas_lineaires(np.asarray(poids, dtype=np.complex128)[np.newaxis], tolerance)
+    return float(pas[0]) if uniformes[0] else None
+
+
+def facteur_reseau_uniforme(psi: np.ndarray, n_elem: int, simple_precision: bool = False) -> np.ndarray:
+    """
+    Module normalisé du facteur de réseau uniforme |sin(N psi / 2) / (N sin(psi / 2))|, sans somme sur les éléments.
+    Près de psi = 0 (modulo 2 pi), où le rapport est indéterminé, son développement 1 - (N² - 1) x² / 6 (x = psi / 2)
+    est utilisé.
+    :param psi: déphasages entre éléments voisins (radians).
+    :param n_elem: nombre d'éléments du réseau.
+    :param simple_precision: calcule en float32.
+    :return: np.array de la forme de psi
+    """
+    reel = np.float32 if simple_precision else np.float64
+    # ramené dans [-pi, pi[ : le module est 2 pi-périodique et sin(x) ne s'annule plus qu'en 0
+    x = (np.mod(np.asarray(psi, dtype=reel) + np.pi, 2 * np.pi) - np.pi) / 2
+    denominateur = n_elem * np.sin(x)
+    proche = np.abs(x) < np.sqrt(np.finfo(reel).eps)
+    af = np.abs(np.divide(np.sin(n_elem * x), denominateur, out=np.ones_like(x), where=~proche))
+    af[proche] = np.abs(1 - (n_elem ** 2 - 1) * x[proche] ** 2 / 6)
+    return af
+
+
+def _module_normalise(poids: np.ndarray, psi: np.ndarray, simple_precision: bool) -> np.ndarray:
+    # module normalisé d'une configuration : forme fermée si possible, sinon somme sur les éléments
+    pas = pas_lineaire(poids)
+    if pas is not None:
+        return facteur_reseau_uniforme(np.asarray(psi) + pas, len(poids), simple_precision)
+    dtype = np.complex64 if simple_precision else np.complex128
+    poids = np.asarray(poids).astype(dtype, copy=False)
+    return np.abs(poids @ matrice_propagation(psi, len(poids), dtype)) / np.abs(poids).sum()
+
+
+def en_db(af: np.ndarray, db: bool = True) -> np.ndarray:
+    """
+    20*log10 d'un module normalisé (borné pour éviter log(0)), ou le module tel quel si db est faux.
+    """
+    if not db:
+        return af
+    np.maximum(af, np.finfo(af.dtype).tiny, out=af)
+    return 20 * np.log10(af)
+
+
+def facteur_reseau_lot(poids: np.ndarray, psi: np.ndarray, simple_precision: bool = False,
+                       db: bool = True, methode: str = "auto") -> np.ndarray:
+    """
+    Facteur de réseau normalisé de plusieurs configurations. Les configurations uniformes (amplitudes égales, phase
+    linéaire) sont évaluées par la forme fermée, sauf pour un lot de réseaux assez petits pour que le produit
+    matriciel coûte moins (COUT_FORME_FERMEE, COUT_PROPAGATION) ; les autres le sont en un seul produit matriciel.
+    :param poids: poids (éventuellement complexes) des éléments, de forme (configurations, éléments).
+    :param psi: déphasages entre éléments voisins (radians), de forme (angles,).
+    :param simple_precision: calcule en complex64 / float32, plus rapide pour les grands balayages.
+    :param db: renvoie 20*log10 du module normalisé, sinon le module normalisé.
+    :param methode: "auto", "matriciel" pour toujours sommer sur les éléments, ou "fft" pour passer par la grille
+        FFT interpolée. En "auto", les poids quelconques passent par la FFT pour les grands réseaux sur des grilles
+        denses (SEUIL_FFT_ELEMENTS, SEUIL_FFT_POINTS_PAR_ELEMENT), quand le lot compte assez peu de configurations
+        pour que les FFT coûtent moins que le produit matriciel (COUT_FFT).
+    :return: np.array de forme (configurations, angles)
+    """
+    if methode not in ("auto", "matriciel", "fft"):
+        raise ValueError(f"méthode inconnue: {methode}")
+    dtype = np.complex64 if simple_precision else np.complex128
+    poids = np.atleast_2d(np.asarray(poids)).astype(dtype, copy=False)
+    psi = np.asarray(psi)
+    n_elem = poids.shape[1]
+    if methode == "auto":
+        uniformes, pas = pas_lineaires(poids)
+        n_uniformes = np.count_nonzero(uniformes)
+        if n_uniformes * COUT_FORME_FERMEE > n_elem * (COUT_PROPAGATION + n_uniformes):
+            # lot de petits réseaux : le produit matriciel est moins cher que la forme fermée
+            uniformes[:] = False
+    else:
+        uniformes, pas = np.zeros(poids.shape[0], dtype=bool), None
+    af = np.empty((poids.shape[0], psi.size), dtype=np.float32 if simple_precision else np.float64)
+    if uniformes.any():
+        # forme fermée de toutes les configurations uniformes en une seule évaluation (configurations, angles)
+        af[uniformes] = facteur_reseau_uniforme(psi[np.newaxis, :] + pas[uniformes, np.newaxis], n_elem,
+                                                simple_precision)
+    if not uniformes.all():
+        autres = poids[~uniformes]
+        n_autres = autres.shape[0]
+        dense = n_elem >= SEUIL_FFT_ELEMENTS and psi.size >= SEUIL_FFT_POINTS_PAR_ELEMENT * n_elem
+        fft_moins_cher = (n_autres * taille_grille_fft(n_elem, psi.size) * COUT_FFT
+                          < n_elem * psi.size * (COUT_PROPAGATION + n_autres))
+        if methode == "fft" or (methode == "auto" and dense and fft_moins_cher):
+            af[~uniformes] = facteur_reseau_interpole(autres, psi, simple_precision=simple_precision, db=False)
+        else:
+            af[~uniformes] = np.abs(autres @ matrice_propagation(psi, n_elem, dtype)) / np.abs(autres).sum(
+                axis=1, keepdims=True)
+    return en_db(af, db)
+
+
+def facteur_reseau_fft(poids: np.ndarray, n_points: int = 4096, simple_precision: bool = False,
+                       db: bool = True):
+    """
+    Facteur de réseau normalisé de poids quelconques sur une grille uniforme de psi couvrant [-pi, pi[, par une FFT
+    complétée de zéros : O(M log M) au lieu de O(N x M).
+    :param poids: poids des éléments, de forme (éléments,) ou (configurations, éléments).
+    :param n_points: nombre de points M de la grille (au moins le nombre d'éléments).
+    :param simple_precision: calcule en complex64 / float32.
+    :param db: renvoie 20*log10 du module normalisé, sinon le module normalisé.
+    :return: (psi de forme (M,), facteur de réseau de forme (M,) ou (configurations, M))
+    """
+    dtype = np.complex64 if simple_precision else np.complex128
+    poids = np.asarray(poids).astype(dtype, copy=False)
+    if n_points < poids.shape[-1]:
+        raise ValueError("la grille doit compter au moins autant de points que d'éléments")
+    # somme des w_n exp(j n psi_k) pour psi_k = 2 pi k / M : transformée inverse non normalisée
+    af = np.abs(np.fft.fftshift(np.fft.ifft(poids, n=n_points, axis=-1), axes=-1)) * n_points
+    af /= np.abs(poids).sum(axis=-1, keepdims=True)
+    psi = 2 * np.pi * (np.arange(n_points) - n_points // 2) / n_points
+    return psi, en_db(af.astype(np.float32 if simple_precision else np.float64, copy=False), db)
+
+
+def separation(matrice: np.ndarray, tolerance: float = 1e-9):
+    """
+    Décomposition w[y, x] = wy[y] * wx[x] d'une pondération de réseau planaire.
+    :param matrice: poids rangés en grille, de forme (ny, nx).
+    :param tolerance: tolérance relative de la vérification.
+    :return: (wy, wx), ou None si la pondération n'est pas séparable.
+    """
+    i, j = np.unravel_index(np.abs(matrice).argmax(), matrice.shape)
+    pivot = matrice[i, j]
+    if pivot == 0:
+        return None
+    poids_x = matrice[i]
+    poids_y = matrice[:, j] / pivot
+    if not np.allclose(np.outer(poids_y, poids_x), matrice, rtol=0, atol=tolerance * abs(pivot)):
+        return None
+    return poids_y, poids_x
+
+
+def taille_grille_fft(n_elem: int, n_psi: int) -> int:
+    """
+    Taille par défaut de la grille FFT : puissance de 2 d'au moins SURECHANTILLONNAGE_FFT points par élément et d'au
+    moins n_psi points.
+    """
+    return 1 << int(max(SURECHANTILLONNAGE_FFT * n_elem, n_psi, 2) - 1).bit_length()
+
+
+def facteur_reseau_interpole(poids: np.ndarray, psi: np.ndarray, n_points: int = None,
+                             simple_precision: bool = False, db: bool = True) -> np.ndarray:
+    """
+    Facteur de réseau normalisé de poids quelconques aux psi demandés : FFT sur une grille uniforme de [-pi, pi[ puis
+    interpolation linéaire périodique. Le facteur de réseau complexe est interpolé après retrait de sa phase linéaire
+    exp(j (N - 1) psi / 2), ce qui le rend lisse et préserve les zéros.
+    :param poids: poids des éléments, de forme (éléments,) ou (configurations, éléments).
+    :param psi: déphasages entre éléments voisins (radians), quelconques.
+    :param n_points: taille de la grille FFT (taille_grille_fft par défaut).
+    :param simple_precision: calcule en complex64 / float32.
+    :param db: renvoie 20*log10 du module normalisé, sinon le module normalisé.
+    :return: np.array de forme (angles,) ou (configurations, angles)
+    """
+    dtype = np.complex64 if simple_precision else np.complex128
+    reel = np.float32 if simple_precision else np.float64
+    poids = np.asarray(poids).astype(dtype, copy=False)
+    lot = np.atleast_2d(poids)
+    psi = np.asarray(psi, dtype=np.float64)
+    n_elem = lot.shape[1]
+    if n_points is None:
+        n_points = taille_grille_fft(n_elem, psi.size)
+    grille = 2 * np.pi * np.arange(n_points) / n_points
+    centrage = np.exp(-0.5j * (n_elem - 1) * grille)
+    spectre = np.fft.ifft(lot, n=n_points, axis=-1) * n_points * centrage
+    spectre /= np.abs(lot).sum(axis=1, keepdims=True)
+    # grille uniforme : indices et poids d'interpolation calculés une fois pour toutes les configurations
+    position = np.mod(psi, 2 * np.pi) * (n_points / (2 * np.pi))
+    gauche = np.floor(position)
+    poids_droite = (position - gauche).astype(reel)
+    gauche = gauche.astype(np.intp) % n_points
+    droite = (gauche + 1) % n_points
+    valeurs = spectre[:, gauche] * (1 - poids_droite) + spectre[:, droite] * poids_droite
+    af = en_db(np.abs(valeurs).astype(reel, copy=False), db)
+    return af if poids.ndim > 1 else af[0]
+
+
+def facteur_reseau_theta(poids: np.ndarray, theta: np.ndarray, distance_element: float, lmbda: float,
+                         pas_de_phase_radians: float = 0, n_points: int = None, simple_precision: bool = False,
+                         db: bool = True) -> np.ndarray:
+    """
+    Facteur de réseau normalisé d'un réseau linéaire sur une grille de directions, par la grille FFT interpolée.
+    :param poids: poids des éléments, de forme (éléments,) ou (configurations, éléments).
+    :param theta: directions d'observation (radians).
+    :param distance_element: distance inter-éléments dans le réseau (en m)
+    :param lmbda: longueur d'onde (en m)
+    :param pas_de_phase_radians: pas de phase appliqué entre deux éléments (radians), en plus de la phase des poids.
+    :param n_points: taille de la grille FFT (voir facteur_reseau_interpole).
+    :return: np.array de forme (angles,) ou (configurations, angles)
+    """
+    psi = psi_depuis_theta(theta, distance_element, lmbda, pas_de_phase_radians)
+    return facteur_reseau_interpole(poids, psi, n_points, simple_precision, db)
+
+
+def directions(azimuts: np.ndarray, elevations: np.ndarray) -> np.ndarray:
+    """
+    Vecteurs unitaires des directions d'observation, l'axe du réseau (z) correspondant à azimut = élévation = 0.
+    :param azimuts: azimuts (radians), de forme (A,).
+    :param elevations: élévations (radians), de forme (E,).
+    :return: np.array de forme (3, E, A) : composantes (u, v, w) = (cos(el) sin(az), sin(el), cos(el) cos(az)).
+    """
+    azimuts, elevations = np.meshgrid(np.atleast_1d(azimuts), np.atleast_1d(elevations))
+    return np.stack((np.cos(elevations) * np.sin(azimuts), np.sin(elevations), np.cos(elevations) * np.cos(azimuts)))
+
+
+class GeometrieReseau:
+    """
+    Géométrie d'un réseau d'antennes : positions des éléments (m) et poids complexes associés. Les réseaux linéaires
+    et planaires réguliers sont repérés à la construction pour que leur diagramme soit calculé de manière séparable.
+    """
+
+    def __init__(self, positions: np.ndarray, poids: Sequence[complex] = None, grille: Sequence[int] = None) -> None:
+        """
+        :param positions: positions des éléments (m), de forme (N, 1), (N, 2) ou (N, 3).
+        :param poids: poids complexes des éléments (1 par défaut).
+        :param grille: (ny, nx) si les éléments forment une grille régulière du plan z = 0 rangée ligne par ligne.
+        """
+        positions = np.atleast_2d(np.asarray(positions, dtype=np.float64))
+        if positions.shape[0] == 1 and positions.shape[1] > 3:
+            positions = positions.T
+        self.positions = np.zeros((positions.shape[0], 3))
+        self.positions[:, :positions.shape[1]] = positions
+        self.poids = np.ones(self.n_elem, dtype=np.complex128) if poids is None else np.asarray(poids, np.complex128)
+        if self.poids.shape != (self.n_elem,):
+            raise ValueError("un poids par élément est attendu")
+        self.grille = tuple(grille) if grille is not None else None
+
+    @classmethod
+    def lineaire(cls, n_elem: int, distance_element: float, poids: Sequence[complex] = None) -> "GeometrieReseau":
+        """
+        Réseau linéaire uniforme le long de l'axe x.
+        """
+        return cls(np.arange(n_elem)[:, None] * distance_element, poids, grille=(1, n_elem))
+
+    @classmethod
+    def planaire(cls, nx: int, ny: int, dx: float, dy: float = None, poids: Sequence[complex] = None
+                 ) -> "GeometrieReseau":
+        """
+        Réseau planaire rectangulaire de nx x ny éléments dans le plan z = 0, rangé ligne par ligne (x varie le plus
+        vite).
+        """
+        dy = dx if dy is None else dy
+        y, x = np.meshgrid(np.arange(ny) * dy, np.arange(nx) * dx, indexing="ij")
+        return cls(np.stack((x.ravel(), y.ravel()), axis=1), poids, grille=(ny, nx))
+
+    @property
+    def n_elem(self) -> int:
+        return self.positions.shape[0]
+
+    def poids_depointage(self, azimut: float, elevation: float, lmbda: float,
+                         amplitudes: Sequence[float] = None) -> np.ndarray:
+        """
+        Poids qui pointent le faisceau dans la direction demandée : a_n * exp(-j k r_n . d0).
+        :param amplitudes: amplitude de chaque élément (module des poids actuels par défaut).
+        :return: np.array de forme (N,)
+        """
+        amplitudes = np.abs(self.poids) if amplitudes is None else np.asarray(amplitudes, dtype=np.float64)
+        direction = directions(azimut, elevation)[:, 0, 0]
+        return amplitudes * np.exp(-2j * np.pi / lmbda * (self.positions @ direction))
+
+    def diagramme(self, azimuts: np.ndarray, elevations: np.ndarray, lmbda: float, poids: np.ndarray = None,
+                  simple_precision: bool = False, db: bool = True) -> np.ndarray:
+        """
+        Diagramme (facteur de réseau normalisé) sur une grille azimut x élévation.
+        :param azimuts: azimuts (radians), de forme (A,).
+        :param elevations: élévations (radians), de forme (E,).
+        :param lmbda: longueur d'onde (en m)
+        :param poids: poids à utiliser à la place de ceux du réseau.
+        :param simple_precision: calcule en complex64 / float32.
+        :param db: renvoie 20*log10 du module normalisé, sinon le module normalisé.
+        :return: np.array de forme (E, A)
+        """
+        dtype = np.complex64 if simple_precision else np.complex128
+        reel = np.float32 if simple_precision else np.float64
+        poids = (self.poids if poids is None else np.asarray(poids)).astype(dtype)
+        k = 2 * np.pi / lmbda
+        cosinus_directeurs = directions(azimuts, elevations).astype(reel)
+        u, v, _ = cosinus_directeurs
+        if self.grille is not None and separation(poids.reshape(self.grille)) is not None:
+            # pondération séparable w[y, x] = wy[y] wx[x] : produit de deux facteurs linéaires, en forme fermée si
+            # chacun est uniforme
+            ny, nx = self.grille
+            poids_y, poids_x = separation(poids.reshape(self.grille))
+            dx = self.positions[1, 0] - self.positions[0, 0] if nx > 1 else 0.0
+            dy = self.positions[nx, 1] - self.positions[0, 1] if ny > 1 else 0.0
+            af = _module_normalise(poids_x, (k * dx * u).ravel(), simple_precision).reshape(u.shape)
+            af *= _module_normalise(poids_y, k * dy * v[:, 0], simple_precision)[:, None]
+            return en_db(af.astype(reel, copy=False), db)
+        if self.grille is not None:
+            # grille du plan z = 0 : exp(jk(x u + y v)) se factorise, v ne dépendant que de l'élévation
+            ny, nx = self.grille
+            x = self.positions[:nx, 0].astype(reel)
+            y = self.positions[::nx, 1].astype(reel)
+            termes_x = np.exp(1j * k * x[:, None, None] * u[None]).astype(dtype, copy=False)  # (nx, E, A)
+            termes_y = np.exp(1j * k * y[:, None] * v[None, :, 0]).astype(dtype, copy=False)  # (ny, E)
+            par_colonne = np.einsum("yx,ye->xe", poids.reshape(ny, nx), termes_y)
+            af = np.abs(np.einsum("xe,xea->ea", par_colonne, termes_x))
+        else:
+            phases = k * np.tensordot(self.positions.astype(reel), cosinus_directeurs, axes=1)  # (N, E, A)
+            af = np.abs(np.tensordot(poids, np.exp(1j * phases).astype(dtype, copy=False), axes=1))
+        af /= np.abs(poids).sum()
+        return en_db(af, db)
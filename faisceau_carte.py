@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Mise à jour à chaud du faisceau émis par une carte en mode standard.
+
+La carte est configurée, remplie et démarrée une fois. Une mise à jour ne refait ensuite que ce qui change :
+- niveau de sortie d'une voie : écriture de son seul registre SPC_AMPx, sans transfert ;
+- pondération ou phase d'une voie : seule sa colonne du buffer DMA entrelacé est resynthétisée, les échantillons des
+  autres voies restent ceux déjà présents dans le buffer, puis la carte est arrêtée, le buffer transféré et le rejeu
+  relancé (en mode standard, la carte refuse un transfert pendant le rejeu) ;
+- fréquence RF : toutes les voies sont resynthétisées.
+Ouverture, type de carte, fréquence d'échantillonnage, voies, filtres et allocation du buffer ne sont pas refaits.
+Les échantillons d'une voie étant répartis sur toute la mémoire de la carte (données entrelacées), le transfert porte
+toujours sur le buffer complet : c'est la synthèse et la configuration qui ne sont payées que pour ce qui change.
+"""
+from typing import Dict, Sequence
+
+import numpy as np
+
+from netbox_api import *
+from synthese_signaux import synthese_entrelacee
+
+
+class FaisceauCarte:
+    """
+    Faisceau d'une carte, dont chaque paramètre peut être modifié pendant l'émission.
+    """
+
+    def __init__(self, session, freq_signal: float, ponderations: Sequence[float], phases_radians: Sequence[float],
+                 facteur_correction: float = 1.6, niveaux=2000, filtres: bool = True,
+                 timeout_duration: int = 10000) -> None:
+        """
+        :param session: CardSession de la carte.
+        :param freq_signal: fréquence RF (Hz).
+        :param ponderations: pondération de chaque voie.
+        :param phases_radians: phase de chaque voie (radians).
+        :param facteur_correction: rapport entre la fréquence d'échantillonnage théorique et celle de la netbox.
+        :param niveaux: amplitude des sorties (mV), une pour toutes les voies ou une par voie.
+        :param filtres: active les filtres des sorties.
+        :param timeout_duration: SPC_TIMEOUT du démarrage (ms).
+        """
+        if len(ponderations) != len(phases_radians):
+            raise ValueError("autant de pondérations que de phases sont attendues")
+        self.session = session
+        self.freq_signal = freq_signal
+        self.facteur_correction = facteur_correction
+        self.ponderations = np.array(ponderations, dtype=np.float64)
+        self.phases_radians = np.array(phases_radians, dtype=np.float64)
+        self.niveaux = niveaux
+        self.filtres = filtres
+        self.timeout_duration = timeout_duration
+        self.en_marche = False
+        self._pv_buffer = None  # buffer DMA dont le contenu correspond au faisceau courant
+        self._voies_synthetisees = []
+
+    @property
+    def n_voies(self) -> int:
+        return self.ponderations.size
+
+    def configuration(self, niveaux=None, filtres: bool = None) -> ConfigurationCarte:
+        # fréquence d'échantillonnage et déclenchement restent ceux réglés par la session
+        return ConfigurationCarte(channels=(1 << self.n_voies) - 1,
+                                  filtres=self.filtres if filtres is None else filtres,
+                                  amplitudes=self.niveaux if niveaux is None else niveaux, freq_ech=None, trigger=None)
+
+    def emettre(self) -> Dict:
+        """
+        Configure la carte, synthétise toutes les voies, les transfère et démarre la carte.
+        :return: résumé de la mise à jour (voir maj).
+        """
+        self._pv_buffer = None
+        return self.maj()
+
+    def maj(self, ponderations: Sequence[float] = None, phases_radians: Sequence[float] = None, niveaux=None,
+            freq_signal: float = None, filtres: bool = None) -> Dict:
+        """
+        Applique un nouveau faisceau en ne refaisant que ce qui a changé. Les paramètres laissés à None sont conservés.
+        L'état de l'objet n'est modifié qu'une fois la carte mise à jour : après une erreur, il décrit toujours ce que
+        la carte émet et la prochaine mise à jour resynthétise toutes les voies.
+        En mode standard, la carte refuse un transfert et un démarrage pendant le rejeu (ERR_RUNNING) : elle est
+        arrêtée avant le transfert puis redémarrée. Un changement de niveau seul ne l'arrête pas.
+        :return: {"voies": voies resynthétisées, "transfert": buffer transféré, "demarrage": carte (re)démarrée}.
+        """
+        ponderations = self.ponderations if ponderations is None else np.asarray(ponderations, dtype=np.float64)
+        phases_radians = self.phases_radians if phases_radians is None else np.asarray(phases_radians,
+                                                                                        dtype=np.float64)
+        if ponderations.shape != self.ponderations.shape or phases_radians.shape != self.phases_radians.shape:
+            raise ValueError(f"une pondération et une phase par voie sont attendues ({self.n_voies} voies)")
+        freq_signal = self.freq_signal if freq_signal is None else freq_signal
+        niveaux = self.niveaux if niveaux is None else niveaux
+        filtres = self.filtres if filtres is None else filtres
+        configuration = self.configuration(niveaux, filtres)
+
+        # registres : seuls les niveaux et filtres modifiés sont écrits (CardSession.appliquer)
+        try:
+            self.session.appliquer(configuration)
+        except Exception:
+            self._pv_buffer = None
+            raise
+        self.niveaux, self.filtres = niveaux, filtres
+
+        if self._pv_buffer is None or self._pv_buffer is not self.session.pv_buffer or \
+                freq_signal != self.freq_signal:
+            # buffer jamais rempli, réalloué (reconnexion, taille) ou fréquence changée : toutes les voies
+            voies = list(range(self.n_voies))
+        else:
+            voies = np.flatnonzero((ponderations != self.ponderations) |
+                                   (phases_radians != self.phases_radians)).tolist()
+        if voies:
+            try:
+                if self.en_marche:
+                    self.session.arreter()
+                    self.en_marche = False
+                self.session.transferer(self._remplissage(voies, freq_signal, ponderations, phases_radians))
+            except Exception:
+                # contenu de la mémoire de la carte inconnu : tout sera resynthétisé et transféré
+                self._pv_buffer = None
+                raise
+            voies = self._voies_synthetisees
+            self.freq_signal, self.ponderations, self.phases_radians = freq_signal, ponderations, phases_radians
+        demarrage = not self.en_marche
+        if demarrage:
+            self.session.demarrer(self.timeout_duration)
+            self.en_marche = True
+        return {"voies": voies, "transfert": bool(voies), "demarrage": demarrage}
+
+    def _remplissage(self, voies, freq_signal, ponderations, phases_radians):
+        def remplir(pv_buffer, taille_buffer):
+            # un buffer qui n'est pas celui déjà rempli est synthétisé en entier
+            partiel = pv_buffer is self._pv_buffer and len(voies) < self.n_voies
+            # le contenu du buffer n'est plus celui du faisceau courant tant que le transfert n'a pas abouti
+            self._pv_buffer = None
+            synthese_entrelacee(vue_buffer_int16(pv_buffer, taille_buffer), freq_signal, ponderations,
+                                phases_radians, self.facteur_correction, voies=voies if partiel else None)
+            self._pv_buffer = pv_buffer
+            self._voies_synthetisees = list(voies) if partiel else list(range(self.n_voies))
+
+        return remplir
+
+    def arreter(self) -> None:
+        """
+        Arrête la carte ; le buffer est conservé, la prochaine mise à jour redémarre la carte.
+        """
+        self.session.arreter()
+        self.en_marche = False
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Rejeu en flux continu (mode SPC_REP_FIFO_SINGLE) pour faire évoluer les pondérations et les phases du faisceau sans
+arrêter la carte.
+
+Un thread producteur alimente un anneau de blocs pris dans un buffer aligné sur les pages : à chaque bloc libéré par
+la carte (SPC_DATA_AVAIL_USER_LEN / SPC_DATA_AVAIL_USER_POS), il synthétise la suite du signal avec le dernier
+faisceau demandé puis rend le bloc à la carte (SPC_DATA_AVAIL_CARD_LEN). La porteuse est prolongée sans saut d'un bloc
+à l'autre : seul le changement de faisceau demandé apparaît en sortie.
+
+Le débit nécessaire vaut fréquence d'échantillonnage x voies x 2 octets ; il doit rester sous celui du lien avec la
+netbox, sans quoi la carte se retrouve à court de données (compté dans `sous_alimentations`). La latence d'un
+changement de faisceau est bornée par la taille de l'anneau plus la profondeur de la FIFO de la carte.
+"""
+import threading
+
+from netbox_api import *
+from synthese_signaux import FREQ_ECH, synthese_entrelacee
+
+
+def init_fifo(hcard, channels=CHANNEL0 | CHANNEL1 | CHANNEL2 | CHANNEL3, filtres=True, backend=None):
+    # mode FIFO : les données sont envoyées en continu au lieu d'être chargées une fois en mémoire
+    backend = pilote(backend)
+    backend.spcm_dwSetParam_i32(hcard, SPC_CARDMODE, SPC_REP_FIFO_SINGLE)
+    backend.spcm_dwSetParam_i64(hcard, SPC_CHENABLE, channels)
+    backend.spcm_dwSetParam_i64(hcard, SPC_LOOPS, 0)  # rejeu sans fin
+    init_sorties(hcard, filtres, channels, backend=backend)
+    return format_echantillons(hcard, backend=backend)
+
+
+class FluxFifo:
+    """
+    Flux FIFO alimenté par un thread producteur. `maj_faisceau` peut être appelée à tout moment depuis un autre thread,
+    le nouveau faisceau est appliqué à partir du prochain bloc rendu à la carte.
+    """
+
+    def __init__(self, session, freq_signal, ponderations, phases_radians, facteur_correction=1.6, filtres=True,
+                 level=2000, taille_bloc=KILO_B(64), n_blocs=4, remplissage_demarrage=1000, timeout_ms=1000,
+                 freq_ech=FREQ_ECH):
+        """
+        :param session: CardSession de la carte à piloter.
+        :param freq_signal: fréquence RF (Hz).
+        :param ponderations: pondération initiale de chaque voie.
+        :param phases_radians: phase initiale de chaque voie (radians).
+        :param facteur_correction: rapport entre la fréquence d'échantillonnage théorique et celle de la netbox.
+        :param filtres: active les filtres des sorties.
+        :param level: amplitude des sorties (mV).
+        :param taille_bloc: taille d'un bloc de l'anneau (octets), multiple de 4096.
+        :param n_blocs: nombre de blocs de l'anneau.
+        :param remplissage_demarrage: remplissage de la FIFO de la carte (pour mille) à atteindre avant de démarrer.
+        :param timeout_ms: attente maximale d'un bloc libre, pour que le thread puisse s'arrêter.
+        :param freq_ech: fréquence d'échantillonnage utilisée pour la synthèse (Hz).
+        """
+        if taille_bloc % 4096:
+            raise ValueError("la taille d'un bloc doit être un multiple de 4096 octets")
+        self.session = session
+        self.freq_signal = freq_signal
+        self.facteur_correction = facteur_correction
+        self.freq_ech = freq_ech
+        self.filtres = filtres
+        self.level = level
+        self.taille_bloc = taille_bloc
+        self.taille_anneau = taille_bloc * n_blocs
+        self.remplissage_demarrage = remplissage_demarrage
+        self.timeout_ms = timeout_ms
+        self.pv_buffer = pvAllocMemPageAligned(self.taille_anneau)
+        self.pn_buffer = vue_buffer_int16(self.pv_buffer, self.taille_anneau)
+        self._faisceau = (tuple(ponderations), tuple(phases_radians))
+        self._arret = threading.Event()
+        self._thread = None
+        self.carte_demarree = False
+        self.echantillons_produits = 0
+        self.blocs_ecrits = 0
+        self.sous_alimentations = 0
+        self.erreur = None
+
+    @property
+    def actif(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def maj_faisceau(self, ponderations=None, phases_radians=None):
+        """
+        Demande un nouveau faisceau. Les paramètres laissés à None sont conservés.
+        """
+        anciennes_ponderations, anciennes_phases = self._faisceau
+        self._faisceau = (anciennes_ponderations if ponderations is None else tuple(ponderations),
+                          anciennes_phases if phases_radians is None else tuple(phases_radians))
+
+    def _remplir(self, position):
+        # synthèse du bloc suivant, à la suite des échantillons déjà produits
+        ponderations, phases_radians = self._faisceau
+        bloc = self.pn_buffer[position // 2:(position + self.taille_bloc) // 2]
+        synthese_entrelacee(bloc, self.freq_signal, ponderations, phases_radians, self.facteur_correction,
+                            self.freq_ech, echantillon_debut=self.echantillons_produits)
+        self.echantillons_produits += bloc.size // len(ponderations)
+        self.blocs_ecrits += 1
+
+    def demarrer(self):
+        """
+        Configure la carte en mode FIFO, pré-remplit l'anneau, lance le DMA puis le thread producteur. La carte est
+        démarrée par le thread dès que sa FIFO est suffisamment remplie.
+        """
+        if self.actif:
+            return
+        self.session.executer(self._demarrer)
+
+    def _demarrer(self, hcard):
+        backend = self.session.backend
+        # la configuration du mode standard n'est plus celle de la carte
+        self.session.configuration = None
+        init_fifo(hcard, filtres=self.filtres, backend=backend)
+        maj_amplitude(hcard, self.level, backend=backend)
+        backend.spcm_dwSetParam_i32(hcard, SPC_TIMEOUT, self.timeout_ms)
+
+        self.echantillons_produits = 0
+        self.carte_demarree = False
+        self.erreur = None
+        for position in range(0, self.taille_anneau, self.taille_bloc):
+            self._remplir(position)
+        backend.spcm_dwDefTransfer_i64(hcard, SPCM_BUF_DATA, SPCM_DIR_PCTOCARD, uint32(self.taille_bloc),
+                                       self.pv_buffer, uint64(0), uint64(self.taille_anneau))
+        backend.spcm_dwSetParam_i64(hcard, SPC_DATA_AVAIL_CARD_LEN, self.taille_anneau)
+        self.session.verifier(backend.spcm_dwSetParam_i32(hcard, SPC_M2CMD, M2CMD_DATA_STARTDMA))
+
+        self._arret.clear()
+        self._thread = threading.Thread(target=self._produire, args=(hcard,), name="producteur FIFO", daemon=True)
+        self._thread.start()
+
+    def _produire(self, hcard):
+        # une erreur du pilote arrête le producteur, son code est conservé dans `erreur`
+        try:
+            self._production(hcard)
+        except ErreurPilote as erreur:
+            self.erreur = erreur.code
+
+    def _production(self, hcard):
+        backend = self.session.backend
+        statut = int32(0)
+        remplissage = int64(0)
+        disponible = int64(0)
+        position = int64(0)
+        while not self._arret.is_set():
+            if not self.carte_demarree:
+                backend.spcm_dwGetParam_i64(hcard, SPC_FILLSIZEPROMILLE, byref(remplissage))
+                if remplissage.value >= self.remplissage_demarrage:
+                    backend.spcm_dwSetParam_i32(hcard, SPC_M2CMD, M2CMD_CARD_START | M2CMD_CARD_ENABLETRIGGER)
+                    self.carte_demarree = True
+
+            dwError = backend.spcm_dwSetParam_i32(hcard, SPC_M2CMD, M2CMD_DATA_WAITDMA)
+            if dwError == ERR_TIMEOUT:
+                continue
+            if dwError != ERR_OK:
+                self.erreur = dwError
+                break
+
+            backend.spcm_dwGetParam_i32(hcard, SPC_M2STATUS, byref(statut))
+            if statut.value & M2STAT_DATA_OVERRUN:
+                self.sous_alimentations += 1
+            backend.spcm_dwGetParam_i64(hcard, SPC_DATA_AVAIL_USER_LEN, byref(disponible))
+            backend.spcm_dwGetParam_i64(hcard, SPC_DATA_AVAIL_USER_POS, byref(position))
+            libre, debut = disponible.value, position.value
+            while libre >= self.taille_bloc:
+                self._remplir(debut)
+                backend.spcm_dwSetParam_i64(hcard, SPC_DATA_AVAIL_CARD_LEN, self.taille_bloc)
+                debut = (debut + self.taille_bloc) % self.taille_anneau
+                libre -= self.taille_bloc
+
+    def arreter(self):
+        """
+        Arrête le thread producteur, la carte et le DMA.
+        """
+        self._arret.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        backend = self.session.backend
+        self.session.executer(lambda hcard: backend.spcm_dwSetParam_i32(hcard, SPC_M2CMD,
+                                                                        M2CMD_CARD_STOP | M2CMD_DATA_STOPDMA))
+        self.carte_demarree = False
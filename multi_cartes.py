@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Pilotage synchronisé de plusieurs cartes, dans une ou plusieurs netbox, pour alimenter des réseaux de plus de quatre
+éléments.
+
+Chaque carte a sa propre CardSession. Ouverture, configuration, transferts et arrêts sont lancés en parallèle dans des
+threads : le temps de mise en route ne croît plus linéairement avec le nombre de cartes. Le démarrage cohérent en
+phase se fait selon le câblage disponible :
+- "starhub" : cartes d'une même netbox reliées par un star-hub. Les cartes sont enregistrées dans le module de
+  synchronisation (SPC_SYNC_ENABLEMASK / SPC_SYNC_CLKMASK) qui distribue l'horloge de la première carte et les démarre
+  d'une seule commande.
+- "trigger" : cartes de netbox différentes. Les esclaves attendent un front sur leur entrée de trigger externe, la
+  carte maître les déclenche par sa sortie de trigger. Une référence d'horloge commune (10 MHz) doit alors être câblée
+  sur toutes les cartes (reference_externe).
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, List, Sequence, Tuple
+
+from netbox_api import *
+from synthese_signaux import synthese_entrelacee
+
+VOIES_PAR_CARTE = 4
+
+
+def ouverture_sync(ip, sync_number=0, backend=None):
+    # module star-hub de la netbox, vu par le pilote comme un périphérique à part
+    address = f'TCPIP::{ip}::sync{sync_number}::INSTR'.encode()
+    hsync = pilote(backend).spcm_hOpen(create_string_buffer(address))
+    if not hsync:
+        raise ConnectionError(f"aucun star-hub trouvé à l'adresse {ip}")
+    return hsync
+
+
+def init_reference_externe(hcard, freq_reference=MEGA(10), backend=None):
+    # horloge de la carte asservie sur une référence externe commune à toutes les cartes
+    backend = pilote(backend)
+    backend.spcm_dwSetParam_i32(hcard, SPC_CLOCKMODE, SPC_CM_EXTREFCLOCK)
+    backend.spcm_dwSetParam_i64(hcard, SPC_REFERENCECLOCK, freq_reference)
+
+
+def init_trigger_esclave(hcard, backend=None):
+    # la carte démarre sur un front montant de son entrée de trigger externe
+    backend = pilote(backend)
+    backend.spcm_dwSetParam_i32(hcard, SPC_TRIG_ORMASK, SPC_TMASK_EXT0)
+    backend.spcm_dwSetParam_i32(hcard, SPC_TRIG_EXT0_MODE, SPC_TM_POS)
+    backend.spcm_dwSetParam_i32(hcard, SPC_TRIGGEROUT, 0)
+
+
+def init_trigger_maitre(hcard, backend=None):
+    # trigger logiciel, recopié sur la sortie de trigger pour déclencher les esclaves
+    backend = pilote(backend)
+    init_trigger(hcard, backend=backend)
+    backend.spcm_dwSetParam_i32(hcard, SPC_TRIGGEROUT, 1)
+
+
+def repartition_voies(valeurs: Sequence, voies_par_carte: int = VOIES_PAR_CARTE, n_cartes: int = None,
+                      complement=0.0) -> List[Sequence]:
+    """
+    Découpe des valeurs par voie (pondérations, phases...) en paquets d'une carte. Chaque carte ayant toutes ses voies
+    actives, le dernier paquet est complété par `complement` jusqu'à voies_par_carte valeurs, et des paquets de
+    complément sont ajoutés jusqu'à n_cartes paquets.
+    :param n_cartes: nombre de cartes disponibles (autant que nécessaire si None).
+    :return: liste de n_cartes paquets de voies_par_carte valeurs.
+    """
+    valeurs = list(valeurs)
+    if n_cartes is None:
+        n_cartes = max(-(-len(valeurs) // voies_par_carte), 1)
+    if len(valeurs) > n_cartes * voies_par_carte:
+        raise ValueError(f"{len(valeurs)} voies ne tiennent pas sur {n_cartes} cartes de {voies_par_carte} voies")
+    valeurs += [complement] * (n_cartes * voies_par_carte - len(valeurs))
+    return [valeurs[i:i + voies_par_carte] for i in range(0, len(valeurs), voies_par_carte)]
+
+
+class MultiCartes:
+    """
+    Ensemble de cartes configurées en parallèle et démarrées de manière cohérente en phase.
+    """
+
+    def __init__(self, cartes: Sequence[Tuple[str, int]], backend=None, synchronisation="starhub", sync_number=0,
+                 reference_externe=False, freq_ech_netbox=625):
+        """
+        :param cartes: (ip, numéro de carte) de chaque carte ; la première est la carte maître.
+        :param backend: pilote à utiliser (backend par défaut si None).
+        :param synchronisation: "starhub" (même netbox) ou "trigger" (netbox différentes).
+        :param sync_number: numéro du star-hub dans la netbox de la carte maître.
+        :param reference_externe: asservit toutes les cartes sur une référence d'horloge externe de 10 MHz.
+        :param freq_ech_netbox: fréquence d'échantillonnage des cartes (MS/s).
+        """
+        if synchronisation not in ("starhub", "trigger"):
+            raise ValueError(f"synchronisation inconnue: {synchronisation}")
+        self.backend = pilote(backend)
+        self.sessions = [CardSession(ip, card_number, backend=backend, freq_ech_netbox=freq_ech_netbox)
+                         for ip, card_number in cartes]
+        self.synchronisation = synchronisation
+        self.sync_number = sync_number
+        self.reference_externe = reference_externe
+        self.hsync = None
+        self.executeur = ThreadPoolExecutor(max_workers=len(self.sessions), thread_name_prefix="carte")
+
+    def __enter__(self):
+        self.ouvrir()
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+    @property
+    def maitre(self):
+        return self.sessions[0]
+
+    def en_parallele(self, operation: Callable, *arguments_par_carte: Sequence) -> list:
+        """
+        Exécute operation(session, *arguments) sur toutes les cartes en même temps. Les arguments sont donnés sous
+        forme de listes, un élément par carte. La première exception levée est propagée une fois toutes les cartes
+        terminées.
+        """
+        futurs = [self.executeur.submit(operation, session, *arguments)
+                  for session, *arguments in zip(self.sessions, *arguments_par_carte)]
+        # aucune carte ne doit être encore en cours d'opération quand l'appelant traite l'erreur
+        wait(futurs)
+        return [futur.result() for futur in futurs]
+
+    def ouvrir(self):
+        self.en_parallele(CardSession.ouvrir)
+        if self.synchronisation == "starhub" and self.hsync is None:
+            self.hsync = ouverture_sync(self.maitre.ip, self.sync_number, backend=self.backend)
+
+    def configurer(self, filtres=True, level=2000):
+        """
+        Configure toutes les cartes en parallèle, déclenchement compris.
+        :return: taille du buffer DMA de chaque carte (octets).
+        """
+        def configuration(session, maitre):
+            taille = session.configurer(filtres=filtres, level=level)
+            if self.reference_externe:
+                session.executer(init_reference_externe, backend=session.backend)
+            if maitre or self.synchronisation == "starhub":
+                session.executer(init_trigger_maitre if self.synchronisation == "trigger" else init_trigger,
+                                 backend=session.backend)
+            else:
+                session.executer(init_trigger_esclave, backend=session.backend)
+            return taille
+
+        return self.en_parallele(configuration, [i == 0 for i in range(len(self.sessions))])
+
+    def transferer(self, remplissages: Sequence[Callable]):
+        """
+        Remplit et transfère en parallèle le buffer de chaque carte, un remplissage par carte.
+        """
+        if len(remplissages) != len(self.sessions):
+            raise ValueError("un remplissage par carte est attendu")
+        self.en_parallele(CardSession.transferer, remplissages)
+
+    def transferer_voies(self, freq_signal, ponderations, phases_radians, facteur_correction=1.6):
+        """
+        Synthétise et transfère les signaux d'un réseau dont les voies sont réparties sur les cartes, dans l'ordre des
+        cartes. Les voies des cartes non utilisées par le réseau sont émises avec une pondération nulle.
+        """
+        if len(ponderations) != len(phases_radians):
+            raise ValueError("autant de pondérations que de phases sont attendues")
+        n_cartes = len(self.sessions)
+
+        def remplissage(ponderations_carte, phases_carte):
+            def remplir(pv_buffer, taille_buffer):
+                synthese_entrelacee(vue_buffer_int16(pv_buffer, taille_buffer), freq_signal, ponderations_carte,
+                                    phases_carte, facteur_correction)
+            return remplir
+
+        self.transferer([remplissage(p, phi) for p, phi in zip(repartition_voies(ponderations, n_cartes=n_cartes),
+                                                               repartition_voies(phases_radians, n_cartes=n_cartes))])
+
+    def demarrer(self, timeout_duration=10000):
+        """
+        Démarre toutes les cartes en même temps.
+        """
+        if self.synchronisation == "starhub":
+            self.ouvrir()
+            # une carte par connecteur du star-hub, repérée par son numéro dans la netbox
+            masque = 0
+            for session in self.sessions:
+                masque |= 1 << session.card_number
+            self.backend.spcm_dwSetParam_i32(self.hsync, SPC_SYNC_ENABLEMASK, masque)
+            # horloge de la carte maître
+            self.backend.spcm_dwSetParam_i32(self.hsync, SPC_SYNC_CLKMASK, 1 << self.maitre.card_number)
+            self.maitre.verifier(start(self.hsync, timeout=True, timeout_duration=timeout_duration,
+                                       exit_on_timeout=True, backend=self.backend))
+        else:
+            # esclaves armés d'abord, ils attendent le trigger de la carte maître
+            futurs = [self.executeur.submit(session.demarrer, timeout_duration) for session in self.sessions[1:]]
+            for futur in futurs:
+                futur.result()
+            self.maitre.demarrer(timeout_duration)
+
+    def arreter(self):
+        if self.hsync is not None:
+            stop(self.hsync, backend=self.backend)
+        self.en_parallele(CardSession.arreter)
+
+    def fermer(self):
+        if self.hsync is not None:
+            fermeture_carte(self.hsync, backend=self.backend)
+            self.hsync = None
+        self.en_parallele(CardSession.fermer)
+        self.executeur.shutdown(wait=True)
@@ -1,8 +1,50 @@
 from pyspcm import *
 from spcm_tools import *
+import pyspcm
+import py_header.regs as regs
+import py_header.spcerr as spcerr
+import bisect
+import os
 import sys
+import threading
+import time
+from collections import deque
+from functools import partial
 import numpy as np
 
+# erreurs du pilote indiquant que la liaison TCP/IP avec la netbox est perdue
+ERREURS_CONNEXION = (ERR_INVALIDHANDLE, ERR_NETWORKSETUP, ERR_NETWORKTRANSFER, ERR_NETWORKTIMEOUT)
+
+
+# backend utilisé quand aucun n'est donné explicitement, choisi au premier appel d'après SPCM_BACKEND
+_backend_defaut = None
+
+
+def backend_depuis_environnement():
+    # SPCM_BACKEND=pilote (défaut) : pilote Spectrum ; SPCM_BACKEND=simule : carte simulée, sans pilote ni netbox
+    nom = os.environ.get("SPCM_BACKEND", "pilote")
+    if nom == "pilote":
+        return pyspcm
+    if nom == "simule":
+        from spcm_simule import CarteSimulee
+        return CarteSimulee()
+    raise ValueError(f"SPCM_BACKEND inconnu: {nom}")
+
+
+def choisir_backend(backend):
+    # remplace le backend par défaut de toutes les fonctions (pyspcm, MockBackend, CarteSimulee...)
+    global _backend_defaut
+    _backend_defaut = backend
+
+
+def pilote(backend=None):
+    # backend utilisé pour les appels au pilote : le backend par défaut, ou un objet exposant les mêmes fonctions
+    if backend is not None:
+        return backend
+    if _backend_defaut is None:
+        choisir_backend(backend_depuis_environnement())
+    return _backend_defaut
+
 
 def sinus(buffer, size):
     taille_buffer = size
@@ -25,27 +67,28 @@ def sinus(buffer, size):
         buffer[i] = int(x)
 
 
-def ouverture_carte(ip, card_number):
+def ouverture_carte(ip, card_number, backend=None):
     address = f'TCPIP::{ip}::inst{card_number}::INSTR'.encode()
-    hcard = spcm_hOpen(create_string_buffer(address))
-    if hcard is None:
+    hcard = pilote(backend).spcm_hOpen(create_string_buffer(address))
+    if not hcard:
         sys.stdout.write("no card found...\n")
-        exit()
+        raise ConnectionError(f"aucune carte trouvée à l'adresse {ip}")
     return hcard
 
 
-def fermeture_carte(hcard):
-    spcm_vClose(hcard)
+def fermeture_carte(hcard, backend=None):
+    pilote(backend).spcm_vClose(hcard)
 
 
-def check_card(hcard):
+def check_card(hcard, backend=None):
+    backend = pilote(backend)
     # read type, function and sn and check for D/A card
     l_card_type = int32(0)
-    spcm_dwGetParam_i32(hcard, SPC_PCITYP, byref(l_card_type))
+    backend.spcm_dwGetParam_i32(hcard, SPC_PCITYP, byref(l_card_type))
     l_serial_number = int32(0)
-    spcm_dwGetParam_i32(hcard, SPC_PCISERIALNO, byref(l_serial_number))
+    backend.spcm_dwGetParam_i32(hcard, SPC_PCISERIALNO, byref(l_serial_number))
     l_fnc_type = int32(0)
-    spcm_dwGetParam_i32(hcard, SPC_FNCTYPE, byref(l_fnc_type))
+    backend.spcm_dwGetParam_i32(hcard, SPC_FNCTYPE, byref(l_fnc_type))
 
     s_card_name = szTypeToName(l_card_type.value)
     print(f"type de carte: {l_fnc_type.value}")
@@ -59,80 +102,251 @@ def check_card(hcard):
         raise TypeError("carte non supportée")
 
 
-def init_vitesse_sampling(lCardType, hCard, freq_ech_netbox=625):
+def init_vitesse_sampling(lCardType, hCard, freq_ech_netbox=625, backend=None):
+    backend = pilote(backend)
     if ((lCardType.value & TYP_SERIESMASK) == TYP_M4IEXPSERIES) or (
             (lCardType.value & TYP_SERIESMASK) == TYP_M4XEXPSERIES):
         # notre cas
-        spcm_dwSetParam_i64(hCard, SPC_SAMPLERATE, MEGA(freq_ech_netbox))
+        backend.spcm_dwSetParam_i64(hCard, SPC_SAMPLERATE, MEGA(freq_ech_netbox))
     else:
-        spcm_dwSetParam_i64(hCard, SPC_SAMPLERATE, MEGA(1))
-    spcm_dwSetParam_i32(hCard, SPC_CLOCKOUT, 0)
+        backend.spcm_dwSetParam_i64(hCard, SPC_SAMPLERATE, MEGA(1))
+    backend.spcm_dwSetParam_i32(hCard, SPC_CLOCKOUT, 0)
 
 
-def init_canaux(hcard, channels=CHANNEL0 | CHANNEL1 | CHANNEL2 | CHANNEL3, filtres=True):
+def init_canaux(hcard, channels=CHANNEL0 | CHANNEL1 | CHANNEL2 | CHANNEL3, filtres=True, memsize=KILO_B(64),
+                backend=None):
+    backend = pilote(backend)
     qwChEnable = channels  # selection des channels actifs
-    llMemSamples = int64(KILO_B(64))
+    llMemSamples = int64(memsize)  # échantillons par voie
     llLoops = int64(0)  # loop continuously
-    spcm_dwSetParam_i32(hcard, SPC_CARDMODE, SPC_REP_STD_CONTINUOUS)
-    spcm_dwSetParam_i64(hcard, SPC_CHENABLE, qwChEnable)
-    spcm_dwSetParam_i64(hcard, SPC_MEMSIZE, llMemSamples)
-    spcm_dwSetParam_i64(hcard, SPC_LOOPS, llLoops)
+    backend.spcm_dwSetParam_i32(hcard, SPC_CARDMODE, SPC_REP_STD_CONTINUOUS)
+    backend.spcm_dwSetParam_i64(hcard, SPC_CHENABLE, qwChEnable)
+    backend.spcm_dwSetParam_i64(hcard, SPC_MEMSIZE, llMemSamples)
+    backend.spcm_dwSetParam_i64(hcard, SPC_LOOPS, llLoops)
+    init_sorties(hcard, filtres, channels, backend=backend)
+
+    lSetChannels, lBytesPerSample = format_echantillons(hcard, backend=backend)
+    buffSize = llMemSamples.value * lBytesPerSample * lSetChannels
+    print(
+        f"nombre d'échantillons: {llMemSamples.value}\nnombre d'octets par échantillon: {lBytesPerSample} nombre de cannaux ouverts: {lSetChannels}\nqwBufferSize: {buffSize}")
+    return buffSize
+
+
+def voies_actives(channels):
+    # indices des voies sélectionnées dans un masque CHANNELx
+    return [voie for voie in range(32) if channels & (1 << voie)]
+
+
+def init_sorties(hcard, filtres=True, channels=CHANNEL0 | CHANNEL1 | CHANNEL2 | CHANNEL3, backend=None):
+    backend = pilote(backend)
+    # les registres d'une voie sont espacés de 100 : SPC_ENABLEOUTx = SPC_ENABLEOUT0 + 100 * x, etc.
+    ecart = SPC_ENABLEOUT1 - SPC_ENABLEOUT0
     # controle du fonctionnement des canaux
-    spcm_dwSetParam_i64(hcard, SPC_ENABLEOUT0, 1)
-    spcm_dwSetParam_i64(hcard, SPC_ENABLEOUT1, 1)
-    spcm_dwSetParam_i64(hcard, SPC_ENABLEOUT2, 1)
-    spcm_dwSetParam_i64(hcard, SPC_ENABLEOUT3, 1)
+    for voie in voies_actives(channels):
+        backend.spcm_dwSetParam_i64(hcard, SPC_ENABLEOUT0 + ecart * voie, 1)
     # filtres sur les sorties
-    if filtres:
-        spcm_dwSetParam_i64(hcard, SPC_FILTER0, 1)
-        spcm_dwSetParam_i64(hcard, SPC_FILTER1, 1)
-        spcm_dwSetParam_i64(hcard, SPC_FILTER2, 1)
-        spcm_dwSetParam_i64(hcard, SPC_FILTER3, 1)
-    else:
-        spcm_dwSetParam_i64(hcard, SPC_FILTER0, 0)
-        spcm_dwSetParam_i64(hcard, SPC_FILTER1, 0)
-        spcm_dwSetParam_i64(hcard, SPC_FILTER2, 0)
-        spcm_dwSetParam_i64(hcard, SPC_FILTER3, 0)
+    for voie in voies_actives(channels):
+        backend.spcm_dwSetParam_i64(hcard, SPC_FILTER0 + ecart * voie, 1 if filtres else 0)
+
 
+def format_echantillons(hcard, backend=None):
+    # nombre de voies actives et nombre d'octets par échantillon
+    backend = pilote(backend)
     lSetChannels = int32(0)
-    spcm_dwGetParam_i32(hcard, SPC_CHCOUNT, byref(lSetChannels))
+    backend.spcm_dwGetParam_i32(hcard, SPC_CHCOUNT, byref(lSetChannels))
     lBytesPerSample = int32(0)
-    spcm_dwGetParam_i32(hcard, SPC_MIINST_BYTESPERSAMPLE, byref(lBytesPerSample))
-
-    buffSize = llMemSamples.value * lBytesPerSample.value * lSetChannels.value
-    print(
-        f"nombre d'échantillons: {llMemSamples.value}\nnombre d'octets par échantillon: {lBytesPerSample.value} nombre de cannaux ouverts: {lSetChannels.value}\nqwBufferSize: {buffSize}")
-    return buffSize
+    backend.spcm_dwGetParam_i32(hcard, SPC_MIINST_BYTESPERSAMPLE, byref(lBytesPerSample))
+    return lSetChannels.value, lBytesPerSample.value
 
 
-def init_trigger(hcard):
+def init_trigger(hcard, backend=None):
+    backend = pilote(backend)
     # setup the trigger mode
     # (SW trigger, no output)
-    spcm_dwSetParam_i32(hcard, SPC_TRIG_ORMASK, SPC_TMASK_SOFTWARE)
+    backend.spcm_dwSetParam_i32(hcard, SPC_TRIG_ORMASK, SPC_TMASK_SOFTWARE)
     value = 0
-    spcm_dwSetParam_i32(hcard, SPC_TRIG_ANDMASK, value)
-    spcm_dwSetParam_i32(hcard, SPC_TRIG_CH_ORMASK0, value)
-    spcm_dwSetParam_i32(hcard, SPC_TRIG_CH_ORMASK1, value)
-    spcm_dwSetParam_i32(hcard, SPC_TRIG_CH_ANDMASK0, value)
-    spcm_dwSetParam_i32(hcard, SPC_TRIG_CH_ANDMASK1, value)
-    spcm_dwSetParam_i32(hcard, SPC_TRIGGEROUT, value)
-
-
-def maj_amplitude(hcard, level=2000):
-    spcm_dwSetParam_i32(hcard, SPC_AMP0, int32(level))
-    spcm_dwSetParam_i32(hcard, SPC_AMP1, int32(level))
-    spcm_dwSetParam_i32(hcard, SPC_AMP2, int32(level))
-    spcm_dwSetParam_i32(hcard, SPC_AMP3, int32(level))
-
-
-def init_buffer(hCard, buffSize):
+    backend.spcm_dwSetParam_i32(hcard, SPC_TRIG_ANDMASK, value)
+    backend.spcm_dwSetParam_i32(hcard, SPC_TRIG_CH_ORMASK0, value)
+    backend.spcm_dwSetParam_i32(hcard, SPC_TRIG_CH_ORMASK1, value)
+    backend.spcm_dwSetParam_i32(hcard, SPC_TRIG_CH_ANDMASK0, value)
+    backend.spcm_dwSetParam_i32(hcard, SPC_TRIG_CH_ANDMASK1, value)
+    backend.spcm_dwSetParam_i32(hcard, SPC_TRIGGEROUT, value)
+
+
+def maj_amplitude(hcard, level=2000, channels=CHANNEL0 | CHANNEL1 | CHANNEL2 | CHANNEL3, backend=None):
+    backend = pilote(backend)
+    ecart = SPC_AMP1 - SPC_AMP0
+    for voie in voies_actives(channels):
+        backend.spcm_dwSetParam_i32(hcard, SPC_AMP0 + ecart * voie, int32(level))
+
+
+class ConfigurationCarte:
+    """
+    Configuration des voies d'une carte (voies actives, filtres, amplitudes, déclenchement, fréquence
+    d'échantillonnage, taille mémoire, rejeux), décrite d'un bloc au lieu d'une suite d'appels init_*.
+
+    `registres` en donne les écritures dans l'ordre où le pilote les attend. Avant tout envoi, la configuration est
+    validée contre les propriétés SPC_MIINST_* de la carte, et seuls les registres qui diffèrent de la configuration
+    déjà appliquée sont écrits, en une seule passe.
+    """
+    # plage des sorties des M4i.66xx (mV)
+    AMPLITUDE_MIN = 80
+    AMPLITUDE_MAX = 2500
+
+    def __init__(self, channels=CHANNEL0 | CHANNEL1 | CHANNEL2 | CHANNEL3, filtres=True, amplitudes=2000,
+                 freq_ech=MEGA(625), memsize=KILO_B(64), loops=0, mode=SPC_REP_STD_CONTINUOUS,
+                 trigger=SPC_TMASK_SOFTWARE, sortie_trigger=False):
+        """
+        :param channels: masque des voies actives (CHANNEL0 | CHANNEL1 ...).
+        :param filtres: filtre des voies actives, un booléen pour toutes ou un par voie.
+        :param amplitudes: amplitude des voies actives (mV), une valeur pour toutes ou une par voie.
+        :param freq_ech: fréquence d'échantillonnage (Hz), None pour la laisser telle quelle.
+        :param memsize: nombre d'échantillons par voie dans la mémoire de la carte.
+        :param loops: nombre de rejeux de la mémoire, 0 pour un rejeu sans fin.
+        :param mode: mode de rejeu (SPC_CARDMODE).
+        :param trigger: masque de déclenchement (SPC_TRIG_ORMASK), None pour laisser le déclenchement tel quel.
+        :param sortie_trigger: recopie le déclenchement sur la sortie de trigger (carte maître).
+        """
+        self.channels = channels
+        self.voies = voies_actives(channels)
+        self.filtres = self._par_voie(filtres, "filtres")
+        self.amplitudes = self._par_voie(amplitudes, "amplitudes")
+        self.freq_ech = freq_ech
+        self.memsize = memsize
+        self.loops = loops
+        self.mode = mode
+        self.trigger = trigger
+        self.sortie_trigger = sortie_trigger
+
+    def _par_voie(self, valeurs, nom):
+        if np.ndim(valeurs) == 0:
+            return (valeurs,) * len(self.voies)
+        valeurs = tuple(valeurs)
+        if len(valeurs) != len(self.voies):
+            raise ValueError(f"{nom} : une valeur par voie active est attendue ({len(self.voies)} voies)")
+        return valeurs
+
+    def __eq__(self, autre):
+        return isinstance(autre, ConfigurationCarte) and self.registres() == autre.registres()
+
+    def __repr__(self):
+        return (f"ConfigurationCarte(voies={self.voies}, filtres={self.filtres}, amplitudes={self.amplitudes}, "
+                f"freq_ech={self.freq_ech}, memsize={self.memsize}, loops={self.loops}, trigger={self.trigger})")
+
+    def registres(self):
+        """
+        Écritures de la configuration, dans l'ordre d'application.
+        :return: dictionnaire ordonné registre -> (fonction du pilote, valeur).
+        """
+        i32, i64 = "spcm_dwSetParam_i32", "spcm_dwSetParam_i64"
+        registres = {}
+        if self.freq_ech is not None:
+            registres[SPC_SAMPLERATE] = (i64, int(self.freq_ech))
+            registres[SPC_CLOCKOUT] = (i32, 0)
+        registres[SPC_CARDMODE] = (i32, self.mode)
+        registres[SPC_CHENABLE] = (i64, self.channels)
+        registres[SPC_MEMSIZE] = (i64, int(self.memsize))
+        registres[SPC_LOOPS] = (i64, int(self.loops))
+        # les registres d'une voie sont espacés de 100 : SPC_ENABLEOUTx = SPC_ENABLEOUT0 + 100 * x, etc.
+        ecart = SPC_ENABLEOUT1 - SPC_ENABLEOUT0
+        for voie, filtre, amplitude in zip(self.voies, self.filtres, self.amplitudes):
+            registres[SPC_ENABLEOUT0 + ecart * voie] = (i64, 1)
+            registres[SPC_FILTER0 + ecart * voie] = (i64, 1 if filtre else 0)
+            registres[SPC_AMP0 + ecart * voie] = (i32, int(amplitude))
+        if self.trigger is not None:
+            registres[SPC_TRIG_ORMASK] = (i32, self.trigger)
+            for registre in (SPC_TRIG_ANDMASK, SPC_TRIG_CH_ORMASK0, SPC_TRIG_CH_ORMASK1, SPC_TRIG_CH_ANDMASK0,
+                             SPC_TRIG_CH_ANDMASK1):
+                registres[registre] = (i32, 0)
+            registres[SPC_TRIGGEROUT] = (i32, 1 if self.sortie_trigger else 0)
+        return registres
+
+    def differences(self, precedente=None):
+        """
+        Écritures nécessaires pour passer de la configuration precedente (état inconnu si None) à celle-ci. Les voies
+        actives dans precedente mais plus dans celle-ci sont désactivées (SPC_ENABLEOUTx et SPC_FILTERx à 0).
+        :return: dictionnaire ordonné registre -> (fonction du pilote, valeur).
+        """
+        registres = self.registres()
+        if precedente is None:
+            return registres
+        anciens = precedente.registres()
+        differences = {registre: ecriture for registre, ecriture in registres.items()
+                       if anciens.get(registre) != ecriture}
+        ecart = SPC_ENABLEOUT1 - SPC_ENABLEOUT0
+        for voie in precedente.voies:
+            if voie not in self.voies:
+                differences[SPC_ENABLEOUT0 + ecart * voie] = ("spcm_dwSetParam_i64", 0)
+                differences[SPC_FILTER0 + ecart * voie] = ("spcm_dwSetParam_i64", 0)
+        return differences
+
+    def erreurs(self, proprietes):
+        """
+        Incohérences de la configuration avec les propriétés de la carte (SPC_MIINST_*, SPC_PCIMEMSIZE) ; les
+        propriétés absentes ne sont pas vérifiées.
+        :return: liste de messages, vide si la configuration est applicable.
+        """
+        erreurs = []
+        n_voies = len(self.voies)
+        voies_carte = proprietes.get(SPC_MIINST_MODULES, 0) * proprietes.get(SPC_MIINST_CHPERMODULE, 0)
+        if not n_voies:
+            erreurs.append("aucune voie active")
+        elif n_voies & (n_voies - 1):
+            erreurs.append(f"{n_voies} voies actives, la carte n'en accepte que 1, 2, 4...")
+        if voies_carte and self.voies and self.voies[-1] >= voies_carte:
+            erreurs.append(f"voie {self.voies[-1]} absente, la carte a {voies_carte} voies")
+        freq_min, freq_max = proprietes.get(SPC_MIINST_MINADCLOCK), proprietes.get(SPC_MIINST_MAXADCLOCK)
+        if self.freq_ech is not None and freq_min and freq_max and not freq_min <= self.freq_ech <= freq_max:
+            erreurs.append(f"fréquence d'échantillonnage {self.freq_ech} Hz hors de [{freq_min}, {freq_max}]")
+        memoire = proprietes.get(SPC_PCIMEMSIZE)
+        octets = self.taille_buffer(proprietes.get(SPC_MIINST_BYTESPERSAMPLE, 2))
+        if self.memsize <= 0:
+            erreurs.append(f"taille mémoire {self.memsize} invalide")
+        elif memoire and octets > memoire:
+            erreurs.append(f"{octets} octets demandés, la carte en a {memoire}")
+        for voie, amplitude in zip(self.voies, self.amplitudes):
+            if not self.AMPLITUDE_MIN <= amplitude <= self.AMPLITUDE_MAX:
+                erreurs.append(f"amplitude {amplitude} mV de la voie {voie} hors de "
+                               f"[{self.AMPLITUDE_MIN}, {self.AMPLITUDE_MAX}]")
+        if self.loops < 0:
+            erreurs.append(f"nombre de rejeux {self.loops} négatif")
+        return erreurs
+
+    def valider(self, proprietes):
+        erreurs = self.erreurs(proprietes)
+        if erreurs:
+            raise ValueError("configuration invalide: " + "; ".join(erreurs))
+
+    def taille_buffer(self, octets_par_echantillon=2):
+        # taille du buffer DMA correspondant à la mémoire de la carte (octets)
+        return self.memsize * len(self.voies) * octets_par_echantillon
+
+    def appliquer(self, hcard, proprietes=None, precedente=None, backend=None):
+        """
+        Valide la configuration puis écrit, dans l'ordre, les registres qui diffèrent de la configuration precedente.
+        :param proprietes: propriétés de la carte (lecture_proprietes), None pour ne pas valider.
+        :param precedente: configuration déjà appliquée sur la carte, None si l'état de la carte est inconnu.
+        :return: les écritures envoyées, registre -> (fonction du pilote, valeur).
+        """
+        if proprietes is not None:
+            self.valider(proprietes)
+        appels = AppelsCarte(hcard, backend)
+        ecritures = {"spcm_dwSetParam_i32": appels.ecrire_i32, "spcm_dwSetParam_i64": appels.ecrire_i64}
+        differences = self.differences(precedente)
+        for registre, (fonction, valeur) in differences.items():
+            ecritures[fonction](registre, valeur)
+        return differences
+
+
+def init_buffer(hCard, buffSize, backend=None):
     # setup software buffer
+    backend = pilote(backend)
     qwBufferSize = uint64(buffSize)
 
     # we try to use continuous memory if available and big enough
     pvBuffer = c_void_p()
     qwContBufLen = uint64(0)
-    spcm_dwGetContBuf_i64(hCard, SPCM_BUF_DATA, byref(pvBuffer), byref(qwContBufLen))
+    backend.spcm_dwGetContBuf_i64(hCard, SPCM_BUF_DATA, byref(pvBuffer), byref(qwContBufLen))
     sys.stdout.write("ContBuf length: {0:d}\n".format(qwContBufLen.value))
     if qwContBufLen.value >= qwBufferSize.value:
         sys.stdout.write("Using continuous buffer\n")
@@ -142,6 +356,14 @@ def init_buffer(hCard, buffSize):
     return pvBuffer
 
 
+def vue_buffer_int16(pvBuffer, buffSize):
+    # vue numpy sur le buffer DMA, sans copie : les échantillons y sont écrits directement
+    if isinstance(pvBuffer, c_void_p):
+        pnBuffer = (c_int16 * (buffSize // sizeof(c_int16))).from_address(pvBuffer.value)
+        return np.ctypeslib.as_array(pnBuffer)
+    return np.frombuffer(pvBuffer, dtype=np.int16, count=buffSize // sizeof(c_int16))
+
+
 def calcul_signaux(pvBuffer):
     # calculate the data
     pnBuffer = cast(pvBuffer, ptr16)
@@ -154,28 +376,600 @@ def calcul_signaux(pvBuffer):
     return pnBuffer
 
 
-def transfert_netbox(hCard, pvBuffer, buffSize):
+def transfert_netbox(hCard, pvBuffer, buffSize, backend=None):
+    backend = pilote(backend)
     # we define the buffer for transfer and start the DMA transfer
     sys.stdout.write("Starting the DMA transfer and waiting until data is in board memory\n")
-    spcm_dwDefTransfer_i64(hCard, SPCM_BUF_DATA, SPCM_DIR_PCTOCARD, int32(0), pvBuffer, uint64(0), buffSize)
-    spcm_dwSetParam_i32(hCard, SPC_M2CMD, M2CMD_DATA_STARTDMA | M2CMD_DATA_WAITDMA)
+    backend.spcm_dwDefTransfer_i64(hCard, SPCM_BUF_DATA, SPCM_DIR_PCTOCARD, uint32(0), pvBuffer, uint64(0), buffSize)
+    dwError = backend.spcm_dwSetParam_i32(hCard, SPC_M2CMD, M2CMD_DATA_STARTDMA | M2CMD_DATA_WAITDMA)
     sys.stdout.write("... data has been transferred to board memory\n")
+    return dwError
 
 
-def stop(hCard):
-    spcm_dwSetParam_i32(hCard, SPC_M2CMD, M2CMD_CARD_STOP)
+def stop(hCard, backend=None):
+    return pilote(backend).spcm_dwSetParam_i32(hCard, SPC_M2CMD, M2CMD_CARD_STOP)
 
 
-def start(hCard, timeout=True, timeout_duration=100, exit_on_timeout=False):
+def start(hCard, timeout=True, timeout_duration=100, exit_on_timeout=False, backend=None):
+    backend = pilote(backend)
     if timeout:
-        spcm_dwSetParam_i32(hCard, SPC_TIMEOUT, timeout_duration)
+        backend.spcm_dwSetParam_i32(hCard, SPC_TIMEOUT, timeout_duration)
     # sys.stdout.write(
     #     "\nStarting the card and waiting for ready interrupt\n(continuous and single restart will have timeout)\n")
 
     # dwError = spcm_dwSetParam_i32(hCard, SPC_M2CMD, M2CMD_CARD_START | M2CMD_CARD_ENABLETRIGGER | M2CMD_CARD_WAITREADY)
-    dwError = spcm_dwSetParam_i32(hCard, SPC_M2CMD, M2CMD_CARD_START |M2CMD_CARD_ENABLETRIGGER)
+    dwError = backend.spcm_dwSetParam_i32(hCard, SPC_M2CMD, M2CMD_CARD_START |M2CMD_CARD_ENABLETRIGGER)
     if exit_on_timeout and dwError == ERR_TIMEOUT:
-        spcm_dwSetParam_i32(hCard, SPC_M2CMD, M2CMD_CARD_STOP)
+        backend.spcm_dwSetParam_i32(hCard, SPC_M2CMD, M2CMD_CARD_STOP)
+    return dwError
+
+
+def lecture_proprietes(hcard, registres, backend=None):
+    # lecture de registres en lecture seule (SPC_MIINST_* ...), renvoyés sous forme de dictionnaire
+    appels = AppelsCarte(hcard, backend)
+    return {registre: appels.lire_i64(registre) for registre in registres}
+
+
+class AppelsCarte:
+    """
+    Appels au pilote liés à une carte, pour les boucles d'écriture et de lecture de registres. Le handle et les
+    fonctions du backend sont liés une fois pour toutes (functools.partial) et les lectures réutilisent la même
+    variable ctypes : un appel ne paie plus la recherche de la fonction ni l'allocation de la variable de retour.
+    Les lectures partagent cette variable, une instance ne doit donc servir qu'à un thread.
+    """
+
+    def __init__(self, hcard, backend=None):
+        backend = pilote(backend)
+        self.hcard = hcard
+        self.ecrire_i32 = partial(backend.spcm_dwSetParam_i32, hcard)
+        self.ecrire_i64 = partial(backend.spcm_dwSetParam_i64, hcard)
+        self._lire_i32 = partial(backend.spcm_dwGetParam_i32, hcard)
+        self._lire_i64 = partial(backend.spcm_dwGetParam_i64, hcard)
+        self._valeur_i32 = int32(0)
+        self._valeur_i64 = int64(0)
+        self._reference_i32 = byref(self._valeur_i32)
+        self._reference_i64 = byref(self._valeur_i64)
+
+    def lire_i32(self, registre):
+        self._lire_i32(registre, self._reference_i32)
+        return self._valeur_i32.value
+
+    def lire_i64(self, registre):
+        self._lire_i64(registre, self._reference_i64)
+        return self._valeur_i64.value
+
+
+def _reference(pointeur):
+    # objet ctypes désigné par byref(...)
+    return getattr(pointeur, "_obj", pointeur)
+
+
+def _valeur(valeur):
+    # valeur python d'un entier éventuellement encapsulé dans un type ctypes
+    return getattr(valeur, "value", valeur)
+
+
+class MockBackend:
+    """
+    Pilote factice exposant les mêmes fonctions que pyspcm, pour faire tourner l'application sans netbox. Les
+    registres sont conservés en mémoire et chaque appel est journalisé dans `appels`. `deconnecter` invalide les
+    handles ouverts, comme une coupure du lien TCP/IP.
+    """
+
+    def __init__(self, card_type=TYP_M4IEXPSERIES | 0x6622, serial_number=1, echecs_ouverture=0):
+        """
+        :param card_type: valeur renvoyée pour SPC_PCITYP (M4i.6622-x8 par défaut).
+        :param serial_number: valeur renvoyée pour SPC_PCISERIALNO.
+        :param echecs_ouverture: nombre d'appels à spcm_hOpen qui échoueront avant de réussir.
+        """
+        self.registres = {SPC_PCITYP: card_type, SPC_PCISERIALNO: serial_number, SPC_FNCTYPE: SPCM_TYPE_AO,
+                          SPC_MIINST_MODULES: 2, SPC_MIINST_CHPERMODULE: 2, SPC_MIINST_BYTESPERSAMPLE: 2,
+                          SPC_MIINST_BITSPERSAMPLE: 16, SPC_MIINST_MAXADCVALUE: 32767,
+                          SPC_MIINST_MINADCLOCK: MEGA(50), SPC_MIINST_MAXADCLOCK: MEGA(625),
+                          SPC_PCIMEMSIZE: GIGA_B(2)}
+        self.echecs_ouverture = echecs_ouverture
+        self.appels = []
+        self.transferts = []
+        self.handles_valides = set()
+        self.dernier_handle = 0
+        self.cartes_en_marche = set()  # handles des cartes démarrées
+        self.fifo = None
+        self.derniere_erreur = (ERR_OK, 0)  # (code, registre) renvoyé par spcm_dwGetErrorInfo_i32
+
+    def deconnecter(self):
+        self.handles_valides.clear()
+        self.cartes_en_marche.clear()
+
+    def _appel(self, nom, hcard, *args):
+        self.appels.append((nom, hcard) + args)
+        if hcard in self.handles_valides:
+            return ERR_OK
+        self.derniere_erreur = (ERR_INVALIDHANDLE, args[0] if args else 0)
+        return ERR_INVALIDHANDLE
+
+    def spcm_hOpen(self, address):
+        self.appels.append(("spcm_hOpen", address.value))
+        if self.echecs_ouverture:
+            self.echecs_ouverture -= 1
+            return None
+        self.dernier_handle += 1
+        self.handles_valides.add(self.dernier_handle)
+        return self.dernier_handle
+
+    def spcm_vClose(self, hcard):
+        self._appel("spcm_vClose", hcard)
+        self.handles_valides.discard(hcard)
+
+    def spcm_dwGetErrorInfo_i32(self, hcard, registre, valeur, texte):
+        # renvoie puis efface la dernière erreur, comme le pilote
+        self.appels.append(("spcm_dwGetErrorInfo_i32", hcard))
+        code, registre_erreur = self.derniere_erreur
+        self.derniere_erreur = (ERR_OK, 0)
+        if registre is not None:
+            _reference(registre).value = registre_erreur
+        if texte is not None and code == ERR_RUNNING:
+            texte.value = b"commande refusee, la carte est en marche"
+        elif texte is not None and code != ERR_OK:
+            texte.value = f"handle {hcard} invalide, liaison perdue".encode()
+        return code
+
+    def spcm_dwGetParam_i32(self, hcard, registre, valeur):
+        if registre == SPC_CHCOUNT:
+            _reference(valeur).value = bin(self.registres.get(SPC_CHENABLE, 0)).count("1")
+        elif registre in (SPC_DATA_AVAIL_USER_LEN, SPC_DATA_AVAIL_USER_POS, SPC_FILLSIZEPROMILLE) and self.fifo:
+            _reference(valeur).value = {SPC_DATA_AVAIL_USER_LEN: self.fifo["libre"],
+                                        SPC_DATA_AVAIL_USER_POS: self.fifo["position"],
+                                        SPC_FILLSIZEPROMILLE: 1000 * (self.fifo["taille"] - self.fifo["libre"])
+                                        // self.fifo["taille"]}[registre]
+        else:
+            _reference(valeur).value = self.registres.get(registre, 0)
+        return self._appel("spcm_dwGetParam_i32", hcard, registre)
+
+    spcm_dwGetParam_i64 = spcm_dwGetParam_i32
+
+    def spcm_dwSetParam_i32(self, hcard, registre, valeur):
+        valeur = _valeur(valeur)
+        erreur = self._appel("spcm_dwSetParam_i32", hcard, registre, valeur)
+        if erreur != ERR_OK:
+            return erreur
+        if registre == SPC_M2CMD and self._refusee(hcard, valeur):
+            # comme le pilote : ni redémarrage ni transfert en mode standard tant que la carte tourne
+            self.derniere_erreur = (ERR_RUNNING, registre)
+            return ERR_RUNNING
+        self.registres[registre] = valeur
+        if registre == SPC_M2CMD:
+            self._commande(hcard, valeur)
+        elif registre == SPC_DATA_AVAIL_CARD_LEN and self.fifo:
+            self.fifo["libre"] -= valeur
+            self.fifo["position"] = (self.fifo["position"] + valeur) % self.fifo["taille"]
+        return erreur
+
+    spcm_dwSetParam_i64 = spcm_dwSetParam_i32
+
+    def _refusee(self, hcard, commande):
+        if hcard not in self.cartes_en_marche:
+            return False
+        fifo = self.registres.get(SPC_CARDMODE) == SPC_REP_FIFO_SINGLE
+        return bool(commande & M2CMD_CARD_START or commande & M2CMD_DATA_STARTDMA and not fifo)
+
+    def _commande(self, hcard, commande):
+        if commande & M2CMD_CARD_START:
+            self.cartes_en_marche.add(hcard)
+        if commande & M2CMD_CARD_STOP:
+            self.cartes_en_marche.discard(hcard)
+        if commande & M2CMD_DATA_STOPDMA:
+            self.fifo = None
+        if commande & M2CMD_DATA_STARTDMA and not self.fifo and self.transferts:
+            self._dma(*self.transferts[-1])
+        if commande & M2CMD_DATA_WAITDMA and self.fifo and hcard in self.cartes_en_marche:
+            self._consommer()
+
+    def _dma(self, pv_buffer, offset, longueur):
+        # mode standard : le transfert vers la mémoire de la carte est instantané
+        pass
+
+    def _consommer(self):
+        # en mode FIFO, la carte en marche consomme instantanément un bloc à chaque attente
+        fifo = self.fifo
+        longueur = min(fifo["notify"], fifo["taille"] - fifo["libre"])
+        debut = fifo["lecture"]
+        fifo["lecture"] = (debut + longueur) % fifo["taille"]
+        fifo["libre"] += longueur
+        return debut, longueur
+
+    def spcm_dwDefTransfer_i64(self, hcard, buffer_type, direction, notify_size, pv_buffer, offset, longueur):
+        erreur = self._appel("spcm_dwDefTransfer_i64", hcard, buffer_type, _valeur(offset), _valeur(longueur))
+        if erreur == ERR_OK:
+            self.transferts.append((pv_buffer, _valeur(offset), _valeur(longueur)))
+            if _valeur(notify_size):
+                self.fifo = {"taille": _valeur(longueur), "notify": _valeur(notify_size), "libre": _valeur(longueur),
+                             "position": 0, "lecture": 0}
+        return erreur
+
+    def spcm_dwInvalidateBuf(self, hcard, buffer_type):
+        return self._appel("spcm_dwInvalidateBuf", hcard, buffer_type)
+
+    def spcm_dwGetContBuf_i64(self, hcard, buffer_type, pv_buffer, longueur):
+        # pas de mémoire continue : le buffer est alloué par l'application
+        _reference(longueur).value = 0
+        return self._appel("spcm_dwGetContBuf_i64", hcard, buffer_type)
+
+
+class RegisterCache:
+    """
+    Backend intermédiaire tenant une copie des registres déjà écrits sur chaque carte, indexée par les constantes de
+    py_header/regs.py. Un spcm_dwSetParam_* n'est envoyé à la netbox que si la valeur diffère de la dernière valeur
+    écrite avec succès ; chaque appel évité est un aller-retour réseau en moins. Les autres fonctions du pilote sont
+    transmises telles quelles.
+    """
+    # registres de commande : chaque écriture déclenche une action et doit toujours être envoyée ; la taille de
+    # segment s'applique au segment sélectionné par SPC_SEQMODE_WRITESEGMENT, elle est donc renvoyée à chaque segment
+    REGISTRES_COMMANDE = frozenset({SPC_M2CMD, SPC_DATA_AVAIL_CARD_LEN, SPC_SEQMODE_WRITESEGMENT,
+                                    SPC_SEQMODE_SEGMENTSIZE})
+
+    def __init__(self, backend=None):
+        self.backend = pilote(backend)
+        self.valeurs = {}
+        self.appels_envoyes = 0
+        self.appels_evites = 0
+
+    def __getattr__(self, nom):
+        return getattr(self.backend, nom)
+
+    def invalider(self, hcard=None):
+        """
+        Oublie les valeurs connues d'une carte (ou de toutes les cartes), par exemple après un reset.
+        """
+        if hcard is None:
+            self.valeurs.clear()
+        else:
+            self.valeurs = {cle: valeur for cle, valeur in self.valeurs.items() if cle[0] != hcard}
+
+    def statistiques(self):
+        return {"envoyes": self.appels_envoyes, "evites": self.appels_evites}
+
+    def _ecrire(self, fonction, hcard, registre, valeur):
+        cle = (hcard, registre)
+        valeur = _valeur(valeur)
+        if registre not in self.REGISTRES_COMMANDE and self.valeurs.get(cle) == valeur:
+            self.appels_evites += 1
+            return ERR_OK
+        self.appels_envoyes += 1
+        try:
+            dwError = fonction(hcard, registre, valeur)
+        except Exception:
+            self.valeurs.pop(cle, None)
+            raise
+        if dwError == ERR_OK and registre not in self.REGISTRES_COMMANDE:
+            self.valeurs[cle] = valeur
+        else:
+            # état du registre inconnu : il sera réécrit à la prochaine demande
+            self.valeurs.pop(cle, None)
+        return dwError
+
+    def spcm_dwSetParam_i32(self, hcard, registre, valeur):
+        return self._ecrire(self.backend.spcm_dwSetParam_i32, hcard, registre, valeur)
+
+    def spcm_dwSetParam_i64(self, hcard, registre, valeur):
+        return self._ecrire(self.backend.spcm_dwSetParam_i64, hcard, registre, valeur)
+
+    def spcm_vClose(self, hcard):
+        self.invalider(hcard)
+        return self.backend.spcm_vClose(hcard)
+
+
+def nom_erreur(code):
+    # nom de la constante ERR_* de py_header/spcerr.py correspondant à un code d'erreur du pilote
+    if not _NOMS_ERREURS:
+        _NOMS_ERREURS.update((valeur, nom) for nom, valeur in vars(spcerr).items() if nom.startswith("ERR_"))
+    return _NOMS_ERREURS.get(code, "ERR_INCONNUE")
+
+
+def nom_registre(registre):
+    # nom de la constante SPC_* de py_header/regs.py correspondant à un registre ; en cas d'alias, la dernière définie,
+    # les anciens noms (SPC_SYNCMASTER...) précédant les actuels (SPC_M2CMD...)
+    if not _NOMS_REGISTRES:
+        _NOMS_REGISTRES.update((valeur, nom) for nom, valeur in vars(regs).items() if nom.startswith("SPC_"))
+    return _NOMS_REGISTRES.get(registre, str(registre))
+
+
+_NOMS_ERREURS = {}
+_NOMS_REGISTRES = {}
+
+
+class ErreurPilote(Exception):
+    """
+    Appel au pilote ayant renvoyé un code d'erreur, avec le diagnostic de spcm_dwGetErrorInfo_i32.
+    """
+
+    def __init__(self, fonction, code, registre=None, valeur=None, texte=""):
+        self.fonction = fonction
+        self.code = code
+        self.registre = registre
+        self.valeur = valeur
+        self.texte = texte
+        appel = fonction if registre is None else f"{fonction}({nom_registre(registre)}, {valeur})"
+        super().__init__(f"{appel}: {nom_erreur(code)} ({code:#x}) {texte}".rstrip())
+
+
+class ErreurConnexionPilote(ErreurPilote, ConnectionError):
+    """
+    Erreur du pilote signifiant que la liaison avec la netbox est perdue : CardSession rouvre la carte et rejoue
+    l'opération.
+    """
+
+
+class PiloteVerifie:
+    """
+    Backend intermédiaire vérifiant le code renvoyé par chaque appel au pilote et mesurant sa durée.
+
+    Un code d'erreur lève ErreurPilote (ErreurConnexionPilote pour une perte de liaison), avec le registre, la valeur
+    et le texte de spcm_dwGetErrorInfo_i32. Les codes tolérés (ERR_TIMEOUT par défaut, attendu d'une attente de DMA
+    ou de démarrage) sont renvoyés tels quels. La durée de chaque appel est comptée dans un histogramme par fonction et
+    par registre, à classes logarithmiques : `statistiques` montre quelles écritures dominent le temps de
+    configuration sur le lien TCP/IP.
+    """
+    # fonctions renvoyant un code d'erreur ; spcm_dwGetErrorInfo_i32 renvoie celui de l'erreur précédente
+    FONCTIONS_VERIFIEES = frozenset({"spcm_dwGetParam_i32", "spcm_dwGetParam_i64", "spcm_dwSetParam_i32",
+                                     "spcm_dwSetParam_i64", "spcm_dwSetParam_i64m", "spcm_dwDefTransfer_i64",
+                                     "spcm_dwInvalidateBuf", "spcm_dwGetContBuf_i64"})
+    # bornes supérieures des classes des histogrammes (s) : 1 µs à 10 s, 4 classes par décade
+    BORNES = tuple(10 ** (exposant / 4 - 6) for exposant in range(29))
+
+    def __init__(self, backend=None, lever=True, tolerees=(ERR_TIMEOUT,), erreurs_max=100):
+        """
+        :param backend: pilote à vérifier (backend par défaut si None).
+        :param lever: lève ErreurPilote sur un code d'erreur ; sinon l'erreur est seulement conservée dans `erreurs`
+            et le code renvoyé.
+        :param tolerees: codes d'erreur renvoyés sans être traités comme des échecs.
+        :param erreurs_max: nombre d'erreurs conservées dans `erreurs`.
+        """
+        self.backend = pilote(backend)
+        self.lever = lever
+        self.tolerees = frozenset(tolerees)
+        self.erreurs = deque(maxlen=erreurs_max)
+        self.histogrammes = {}  # (fonction, registre) -> [nombre, durée totale, durée max, comptes par classe]
+        self._verrou = threading.Lock()
+
+    def __getattr__(self, nom):
+        fonction = getattr(self.backend, nom)
+        if not nom.startswith("spcm_"):
+            return fonction
+        appel = self._encapsuler(nom, fonction)
+        # résolu une seule fois : les appels suivants ne repassent plus par __getattr__
+        setattr(self, nom, appel)
+        return appel
+
+    def _encapsuler(self, nom, fonction):
+        verifiee = nom in self.FONCTIONS_VERIFIEES
+        avec_registre = "Param" in nom
+
+        def appel(*args):
+            debut = time.perf_counter()
+            dwError = fonction(*args)
+            self._compter(nom, args[1] if avec_registre else None, time.perf_counter() - debut)
+            if verifiee and dwError != ERR_OK and dwError not in self.tolerees:
+                self._echec(nom, dwError, args)
+            return dwError
+
+        appel.__name__ = nom
+        return appel
+
+    def _compter(self, nom, registre, duree):
+        cle = (nom, registre)
+        with self._verrou:
+            histogramme = self.histogrammes.get(cle)
+            if histogramme is None:
+                histogramme = self.histogrammes[cle] = [0, 0.0, 0.0, [0] * (len(self.BORNES) + 1)]
+            histogramme[0] += 1
+            histogramme[1] += duree
+            histogramme[2] = max(histogramme[2], duree)
+            histogramme[3][bisect.bisect_left(self.BORNES, duree)] += 1
+
+    def _echec(self, nom, dwError, args):
+        hcard = args[0]
+        registre = args[1] if "Param" in nom else None
+        valeur = _valeur(args[2]) if nom.startswith("spcm_dwSetParam") else None
+        texte = self.info_erreur(hcard)
+        classe = ErreurConnexionPilote if dwError in ERREURS_CONNEXION else ErreurPilote
+        erreur = classe(nom, dwError, registre, valeur, texte)
+        self.erreurs.append(erreur)
+        if self.lever:
+            raise erreur
+
+    def info_erreur(self, hcard):
+        """
+        Texte de la dernière erreur de la carte (spcm_dwGetErrorInfo_i32), vide si le pilote n'en donne pas.
+        """
+        texte = create_string_buffer(ERRORTEXTLEN)
+        try:
+            self.backend.spcm_dwGetErrorInfo_i32(hcard, byref(uint32(0)), byref(int32(0)), texte)
+        except OSError:
+            return ""
+        return texte.value.decode(errors="replace").strip()
+
+    def reinitialiser(self):
+        with self._verrou:
+            self.histogrammes.clear()
+        self.erreurs.clear()
+
+    def _quantile(self, histogramme, q):
+        # borne supérieure de la classe atteignant la fraction q des appels (durée max pour la dernière classe)
+        nombre, _, duree_max, comptes = histogramme
+        cumul = 0
+        for classe, compte in enumerate(comptes):
+            cumul += compte
+            if cumul >= q * nombre:
+                return min(self.BORNES[classe], duree_max) if classe < len(self.BORNES) else duree_max
+        return duree_max
+
+    def statistiques(self):
+        """
+        Durées des appels par fonction et par registre, de la plus coûteuse au total à la moins coûteuse.
+        :return: liste de dictionnaires (fonction, registre, n, total_ms, moyenne_us, p50_us, p99_us, max_us).
+        """
+        with self._verrou:
+            histogrammes = {cle: (h[0], h[1], h[2], list(h[3])) for cle, h in self.histogrammes.items()}
+        lignes = []
+        for (fonction, registre), histogramme in histogrammes.items():
+            nombre, total, duree_max, _ = histogramme
+            lignes.append({"fonction": fonction, "registre": None if registre is None else nom_registre(registre),
+                           "n": nombre, "total_ms": total * 1e3, "moyenne_us": total / nombre * 1e6,
+                           "p50_us": self._quantile(histogramme, 0.5) * 1e6,
+                           "p99_us": self._quantile(histogramme, 0.99) * 1e6, "max_us": duree_max * 1e6})
+        return sorted(lignes, key=lambda ligne: ligne["total_ms"], reverse=True)
+
+
+class CardSession:
+    """
+    Session longue durée sur une carte de la netbox.
+
+    La carte reste ouverte d'une action à l'autre : son type et ses propriétés SPC_MIINST_* ne sont lus qu'à la
+    première connexion, la fréquence d'échantillonnage n'est réglée qu'à l'ouverture, les voies ne sont reconfigurées
+    que si leurs paramètres changent et le buffer DMA est réutilisé. Une mise à jour des phases ne paie donc plus que
+    le transfert des données. Si le lien avec la netbox est perdu, la carte est rouverte et l'opération rejouée.
+    """
+    PROPRIETES = (SPC_MIINST_MODULES, SPC_MIINST_CHPERMODULE, SPC_MIINST_BYTESPERSAMPLE, SPC_MIINST_BITSPERSAMPLE,
+                  SPC_MIINST_MAXADCVALUE, SPC_MIINST_MINADCLOCK, SPC_MIINST_MAXADCLOCK, SPC_PCIMEMSIZE)
+
+    def __init__(self, ip="169.254.114.9", card_number=0, backend=None, freq_ech_netbox=625, tentatives=2,
+                 cache_registres=True, verification=True):
+        """
+        :param ip: adresse de la netbox.
+        :param card_number: numéro de la carte dans la netbox.
+        :param backend: pilote à utiliser (backend par défaut si None, MockBackend ou CarteSimulee pour travailler
+            sans matériel).
+        :param freq_ech_netbox: fréquence d'échantillonnage de la carte (MS/s).
+        :param tentatives: nombre de tentatives pour une opération avant d'abandonner.
+        :param cache_registres: n'envoyer que les écritures de registres qui changent une valeur (RegisterCache).
+        :param verification: lever ErreurPilote sur tout code d'erreur du pilote et mesurer la durée des appels
+            (PiloteVerifie, accessible par `pilote_verifie`).
+        """
+        self.ip = ip
+        self.card_number = card_number
+        # le cache est placé au-dessus de la vérification : seuls les appels réellement envoyés sont mesurés
+        self.pilote_verifie = PiloteVerifie(backend) if verification else None
+        backend = self.pilote_verifie or pilote(backend)
+        self.backend = RegisterCache(backend) if cache_registres else backend
+        self.freq_ech_netbox = freq_ech_netbox
+        self.tentatives = tentatives
+        self.hcard = None
+        self.card_type = None
+        self.proprietes = {}
+        self.parametres = ConfigurationCarte(freq_ech=None, trigger=None)
+        self.configuration = None  # ConfigurationCarte effectivement appliquée sur la carte, None si inconnue
+        self.taille_buffer = 0
+        self.pv_buffer = None
+        self.taille_pv_buffer = 0
+
+    def __enter__(self):
+        self.ouvrir()
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+    @property
+    def ouverte(self):
+        return self.hcard is not None
+
+    def ouvrir(self):
+        """
+        Ouvre la carte si elle ne l'est pas déjà.
+        :return: le handle de la carte.
+        """
+        if self.hcard is None:
+            hcard = ouverture_carte(self.ip, self.card_number, backend=self.backend)
+            try:
+                if self.card_type is None:
+                    self.card_type = check_card(hcard, backend=self.backend)
+                    self.proprietes = lecture_proprietes(hcard, self.PROPRIETES, backend=self.backend)
+                init_vitesse_sampling(self.card_type, hcard, self.freq_ech_netbox, backend=self.backend)
+            except Exception:
+                fermeture_carte(hcard, backend=self.backend)
+                raise
+            self.hcard = hcard
+            self.configuration = None
+            self.pv_buffer = None
+        return self.hcard
+
+    def fermer(self):
+        if self.hcard is not None:
+            fermeture_carte(self.hcard, backend=self.backend)
+        self.hcard = None
+        self.configuration = None
+        self.pv_buffer = None
+
+    def verifier(self, dwError):
+        # une erreur réseau signifie que le handle n'est plus utilisable
+        if dwError in ERREURS_CONNEXION:
+            raise ConnectionError(f"liaison avec la netbox perdue (erreur {dwError:#x})")
+        return dwError
+
+    def executer(self, operation, *args, **kwargs):
+        """
+        Exécute operation(hcard, *args, **kwargs) sur la carte, en rouvrant la carte et en rejouant l'opération si la
+        liaison avec la netbox est perdue.
+        :return: le résultat de l'opération.
+        """
+        for tentative in range(self.tentatives):
+            try:
+                return operation(self.ouvrir(), *args, **kwargs)
+            except ConnectionError:
+                if self.hcard is not None:
+                    self.fermer()
+                if tentative + 1 == self.tentatives:
+                    raise
+
+    def configurer(self, filtres=True, level=2000):
+        """
+        Enregistre la configuration des voies et l'applique si elle a changé. La fréquence d'échantillonnage, réglée
+        à l'ouverture, et le déclenchement ne sont pas modifiés.
+        :return: taille du buffer DMA (octets).
+        """
+        return self.appliquer(ConfigurationCarte(filtres=filtres, amplitudes=level, freq_ech=None, trigger=None))
+
+    def appliquer(self, configuration):
+        """
+        Enregistre une configuration complète, la valide contre les propriétés de la carte et n'en écrit que les
+        registres qui diffèrent de la configuration appliquée.
+        :return: taille du buffer DMA (octets).
+        """
+        return self.executer(self._appliquer_configuration, configuration)
+
+    def _appliquer_configuration(self, hcard, configuration=None):
+        # une configuration refusée par la validation ne remplace pas celle enregistrée
+        configuration = self.parametres if configuration is None else configuration
+        if self.configuration != configuration:
+            configuration.valider(self.proprietes)
+            # état de la carte inconnu tant que toutes les écritures ne sont pas passées
+            precedente, self.configuration = self.configuration, None
+            configuration.appliquer(hcard, precedente=precedente, backend=self.backend)
+            self.configuration = configuration
+            self.taille_buffer = configuration.taille_buffer(self.proprietes.get(SPC_MIINST_BYTESPERSAMPLE, 2))
+        self.parametres = configuration
+        return self.taille_buffer
+
+    def transferer(self, remplissage):
+        """
+        Remplit le buffer DMA avec remplissage(pv_buffer, taille_buffer) et le transfère dans la mémoire de la carte.
+        """
+        def operation(hcard):
+            self._appliquer_configuration(hcard)
+            if self.pv_buffer is None or self.taille_pv_buffer != self.taille_buffer:
+                self.pv_buffer = init_buffer(hcard, self.taille_buffer, backend=self.backend)
+                self.taille_pv_buffer = self.taille_buffer
+            remplissage(self.pv_buffer, self.taille_buffer)
+            self.verifier(transfert_netbox(hcard, self.pv_buffer, self.taille_buffer, backend=self.backend))
+
+        self.executer(operation)
+
+    def demarrer(self, timeout_duration=10000):
+        self.executer(lambda hcard: self.verifier(start(hcard, timeout=True, timeout_duration=timeout_duration,
+                                                        exit_on_timeout=True, backend=self.backend)))
+
+    def arreter(self):
+        self.executer(lambda hcard: self.verifier(stop(hcard, backend=self.backend)))
 
 
 if __name__ == "__main__":
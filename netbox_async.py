@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Façade asyncio de CardSession, pour piloter les cartes depuis une boucle d'événements (serveur de suivi, sockets de
+position...).
+
+Les appels au pilote sont bloquants : chaque carte a son propre thread d'exécution, qui les enchaîne dans l'ordre de
+soumission. Les méthodes de CarteAsync soumettent l'opération dès leur appel et renvoient un awaitable : plusieurs
+opérations peuvent donc être mises en file sans attendre la fin de la précédente (configuration, transfert puis
+démarrage partent à la suite dans le thread de la carte), et plusieurs cartes travaillent en même temps.
+
+Chaque opération accepte un timeout (s). Une opération annulée (ou dont le timeout expire) avant d'avoir commencé n'est
+pas exécutée ; un appel au pilote déjà en cours ne peut pas être interrompu, il se termine et son résultat est ignoré.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from netbox_api import *
+# après l'import du pilote, dont ctypes.Union masquerait typing.Union
+from typing import Awaitable, Callable, Mapping, Union
+
+
+def remplissage_depuis(donnees: Union[Callable, np.ndarray]) -> Callable:
+    """
+    Fonction de remplissage du buffer DMA : celle donnée, ou la copie d'échantillons int16 déjà entrelacés.
+    """
+    if callable(donnees):
+        return donnees
+    donnees = np.asarray(donnees, dtype=np.int16).ravel()
+
+    def remplir(pv_buffer, taille_buffer):
+        destination = vue_buffer_int16(pv_buffer, taille_buffer)
+        if donnees.size != destination.size:
+            raise ValueError(f"{donnees.size} échantillons fournis, {destination.size} attendus par le buffer DMA")
+        np.copyto(destination, donnees)
+
+    return remplir
+
+
+class CarteAsync:
+    """
+    Carte pilotée depuis asyncio. Les appels au pilote sont exécutés par un thread dédié à la carte.
+    """
+
+    def __init__(self, session: CardSession = None, **parametres_session) -> None:
+        """
+        :param session: session à piloter ; à défaut une CardSession est créée avec parametres_session (ip,
+            card_number, backend...).
+        """
+        self.session = session if session is not None else CardSession(**parametres_session)
+        self.executeur = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"carte{self.session.card_number}")
+
+    async def __aenter__(self):
+        await self.ouvrir()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.fermer()
+
+    def soumettre(self, operation: Callable, *args, timeout: float = None, **kwargs) -> Awaitable:
+        """
+        Met operation(*args, **kwargs) dans la file du thread de la carte.
+        :param timeout: durée maximale d'attente du résultat (s), None pour attendre sans limite.
+        :return: awaitable donnant le résultat de l'opération.
+        """
+        futur = asyncio.wrap_future(self.executeur.submit(operation, *args, **kwargs))
+        return futur if timeout is None else asyncio.wait_for(futur, timeout)
+
+    def ouvrir(self, timeout: float = None) -> Awaitable:
+        return self.soumettre(self.session.ouvrir, timeout=timeout)
+
+    def configurer(self, filtres=True, level=2000, timeout: float = None) -> Awaitable:
+        """
+        :return: awaitable donnant la taille du buffer DMA (octets).
+        """
+        return self.soumettre(self.session.configurer, filtres, level, timeout=timeout)
+
+    def ecrire_registres(self, registres: Mapping[int, int], timeout: float = None) -> Awaitable:
+        """
+        Écrit une série de registres en une seule opération, dans l'ordre donné.
+        """
+        backend = self.session.backend
+
+        def ecriture(hcard):
+            for registre, valeur in registres.items():
+                self.session.verifier(backend.spcm_dwSetParam_i64(hcard, registre, valeur))
+
+        return self.soumettre(self.session.executer, ecriture, timeout=timeout)
+
+    def transferer(self, donnees: Union[Callable, np.ndarray], timeout: float = None) -> Awaitable:
+        """
+        Transfère des signaux dans la mémoire de la carte.
+        :param donnees: fonction de remplissage (pv_buffer, taille_buffer), exécutée dans le thread de la carte, ou
+            tableau d'échantillons int16 entrelacés de la taille du buffer DMA.
+        """
+        return self.soumettre(self.session.transferer, remplissage_depuis(donnees), timeout=timeout)
+
+    def demarrer(self, timeout_duration=10000, timeout: float = None) -> Awaitable:
+        return self.soumettre(self.session.demarrer, timeout_duration, timeout=timeout)
+
+    def arreter(self, timeout: float = None) -> Awaitable:
+        return self.soumettre(self.session.arreter, timeout=timeout)
+
+    async def fermer(self) -> None:
+        """
+        Ferme la carte une fois les opérations en file terminées, puis arrête son thread.
+        """
+        try:
+            await self.soumettre(self.session.fermer)
+        finally:
+            self.executeur.shutdown(wait=False)
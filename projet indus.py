@@ -4,14 +4,18 @@ import tkinter
 import matplotlib
 from matplotlib import pyplot as plt
 from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 import tkinter as tk
 from netbox_api import *
-from itertools import chain
-from typing import List, Tuple, Dict, Callable
+from facteur_reseau import facteur_reseau_lot
+from synthese_signaux import base_temps, synthese_voies, synthese_entrelacee
+from travailleur_carte import TravailleurCarte
+from faisceau_carte import FaisceauCarte
+from typing import List, Tuple, Dict, Callable, Sequence
 
 matplotlib.use("TkAgg")
 LARGE_FONT = ("Verdana", 12)
+PERIODE_RELEVE_MS = 20  # relevé des opérations terminées sur la carte
 
 
 def generer_secteur_angulaire(distance_element: float, lmbda: float) -> List[Tuple[np.array, np.array, str]]:
@@ -57,7 +61,7 @@ def calcul_phase_secteur_angulaire(pas_de_phase_radians: float, distance_element
 
 
 def generer_zone_visible(pas_de_phase_radians: float, distance_element: float, lmbda: float, orientation_cible_radians,
-                         n_elem: int = 4, amplitudes: Tuple[float, float, float, float] = (1, 1, 1, 1),
+                         n_elem: int = 4, amplitudes: Sequence[float] = (1, 1, 1, 1),
                          n_points: int = 500) -> Dict:
     """
     Calcule les données nécessaires pour l'affichage de la zone visible
@@ -99,21 +103,7 @@ def borne_zone_visible(pas_de_phase_radians: float, distance_element: float, lmb
             pas_de_phase_radians + 2 * np.pi * distance_element / lmbda)
 
 
-def calcul_sinus_analogique(freq_signal, amplitude, phase_radians, facteur_correction, taille_buffer=65536):
-    freq_ech = 1e9  # Hz
-    dt = 1 / freq_ech  # s
-
-    freq_signal = facteur_correction * freq_signal
-
-    # échelle des temps
-    temps = np.array([i * dt for i in range(taille_buffer)])
-
-    # signaux normalisés a 1
-    sinus = amplitude * np.sin(2 * np.pi * freq_signal * temps + phase_radians)
-    return temps, sinus
-
-
-def calculer_facteur_reseau(psi: np.array, n_elem: int = 4, amplitudes: Tuple[float, float, float, float] = (1, 1, 1, 1)
+def calculer_facteur_reseau(psi: np.array, n_elem: int = 4, amplitudes: Sequence[float] = (1, 1, 1, 1)
                             ) -> np.array:
     """
     Calcule le module du facteur de réseau en fonction de psi, du nombre d'éléments dans le réseau, ainsi que des
@@ -123,10 +113,78 @@ def calculer_facteur_reseau(psi: np.array, n_elem: int = 4, amplitudes: Tuple[fl
     :param amplitudes: liste d'amplitudes correspondant aux éléments du réseau.
     :return: np.array
     """
-    af = amplitudes[0] * np.exp(0 * 1j * psi)
-    for i in range(1, n_elem):
-        af += amplitudes[i] * np.exp(i * 1j * psi)
-    return 20*np.log10(np.abs(af/sum(amplitudes)))
+    return facteur_reseau_lot(np.asarray(amplitudes[:n_elem]), psi)[0]
+
+
+class RenduBlit:
+    """
+    Rendu par blitting d'une figure dont les courbes sont persistantes. Le fond (axes, graduations, titres) est
+    mémorisé à chaque rendu complet, puis une mise à jour ne redessine que les courbes par-dessus ce fond. Le rendu
+    complet n'est refait que si les limites d'un des axes ont changé ou si le canvas a été redessiné (redimensionnement).
+    """
+
+    def __init__(self, canvas: FigureCanvasTkAgg, artistes: Sequence) -> None:
+        """
+        :param canvas: canvas Tk de la figure.
+        :param artistes: courbes mises à jour par set_data.
+        """
+        self.canvas = canvas
+        self.artistes = list(artistes)
+        self.fond = None
+        self.limites = None
+        for artiste in self.artistes:
+            artiste.set_animated(True)
+        canvas.mpl_connect("draw_event", self.sur_rendu_complet)
+
+    def limites_axes(self) -> Tuple:
+        return tuple(axe.get_xlim() + axe.get_ylim() for axe in self.canvas.figure.axes)
+
+    def sur_rendu_complet(self, event) -> None:
+        # le fond vient d'être dessiné sans les courbes animées : on le garde puis on ajoute les courbes
+        self.fond = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.limites = self.limites_axes()
+        for artiste in self.artistes:
+            self.canvas.figure.draw_artist(artiste)
+
+    def redessiner(self) -> None:
+        """
+        Affiche l'état courant des courbes.
+        :return: None
+        """
+        if self.fond is None or self.limites != self.limites_axes():
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.fond)
+        for artiste in self.artistes:
+            self.canvas.figure.draw_artist(artiste)
+        self.canvas.blit(self.canvas.figure.bbox)
+
+
+def enveloppe_min_max(temps: np.array, signal: np.array, t_min: float, t_max: float, n_colonnes: int
+                      ) -> Tuple[np.array, np.array]:
+    """
+    Points à tracer pour la portion visible d'un signal échantillonné. Tant que la fenêtre compte peu d'échantillons
+    par colonne de pixels, ils sont renvoyés tels quels ; sinon chaque colonne est résumée par le minimum et le
+    maximum de ses échantillons, ce qui conserve l'enveloppe du signal. Le nombre de points tracés ne dépend donc que
+    de la largeur de l'axe, pas de la taille du buffer.
+    :param temps: instants des échantillons (s), croissants.
+    :param signal: échantillons.
+    :param t_min: début de la fenêtre visible (s).
+    :param t_max: fin de la fenêtre visible (s).
+    :param n_colonnes: largeur de l'axe en pixels.
+    :return: Tuple[np.array, np.array]
+    """
+    # un échantillon de part et d'autre pour que la courbe touche les bords de l'axe
+    debut = max(int(np.searchsorted(temps, t_min)) - 1, 0)
+    fin = min(int(np.searchsorted(temps, t_max)) + 1, len(temps))
+    n_colonnes = max(n_colonnes, 1)
+    if fin - debut <= 2 * n_colonnes:
+        return temps[debut:fin], signal[debut:fin]
+    par_colonne = (fin - debut) // n_colonnes
+    indices = np.arange(0, fin - debut, par_colonne)
+    fenetre = signal[debut:fin]
+    y = np.column_stack((np.minimum.reduceat(fenetre, indices), np.maximum.reduceat(fenetre, indices))).ravel()
+    return np.repeat(temps[debut:fin][indices], 2), y
 
 
 def maj_stringvar(stringvar1: tkinter.StringVar, stringvar2: tkinter.StringVar, fonction: Callable) -> None:
@@ -258,16 +316,34 @@ class MainFrame(tk.Frame):
         self.canvas_zone_visible = FigureCanvasTkAgg(self.figure_zone_visible, master=self.main)
         self.canvas_signaux_generes = FigureCanvasTkAgg(self.figure_signaux_generes, master=self.main)
 
+        # carte de la netbox, gardée ouverte pendant toute la durée de l'application
+        self.session = CardSession("169.254.114.9", 0)
+        # faisceau émis, créé au premier envoi puis mis à jour à chaud (seules les voies modifiées sont recalculées)
+        self.faisceau = None
+
+        # mise à jour des figures programmée après l'envoi des signaux
+        self.figures_perimees = False
+        self.maj_figures_planifiee = None
+        self.main.bind("<Map>", self.fenetre_affichee, add="+")
+
+        # les opérations sur la carte tournent dans un thread dédié, leurs rappels sont relevés périodiquement
+        self.travailleur = TravailleurCarte()
+        self.after(PERIODE_RELEVE_MS, self.relever_travailleur)
+
+        # axes et courbes créés une seule fois, mis à jour ensuite par set_data
+        self.initialisation_figure_angulaire()
+        self.initialisation_figure_zone_visible()
+        self.initialisation_figure_signaux_generes()
+
         # init visual
         self.initialisation_widgets()
 
     def initialisation_figure_angulaire(self) -> None:
         """
-        Permet distance_element'initialiser la figure angulaire de l'application.
+        Crée une fois pour toutes les axes et les courbes de la figure angulaire.
         :return: None
         """
-        axe = self.figure_secteur_angulaire.gca(polar=True)
-        axe.clear()
+        axe = self.figure_secteur_angulaire.add_subplot(projection="polar")
         maximum = 1
         minimum = 0
         nb_lines = 5
@@ -278,7 +354,10 @@ class MainFrame(tk.Frame):
         axe.set_xlim(left=np.pi, right=0, auto=False)  # gestion des limites angulaires
         axe.set_rlabel_position(-22.5)
         axe.set_yticklabels([])
-        # axe.title("dépointage")
+        axe.set_title("dépointage")
+        # secteur angulaire, ses deux bornes et le dépointage réalisé
+        self.lignes_secteur_angulaire = [axe.plot([], [], color=color)[0] for color in ("blue", "red", "red", "g")]
+        self.rendu_secteur_angulaire = RenduBlit(self.canvas_secteur_angulaire, self.lignes_secteur_angulaire)
 
     def maj_figure_angulaire(self, pas_de_phase_radians: float, distance_element: float, lmbda: float) -> None:
         """
@@ -288,26 +367,27 @@ class MainFrame(tk.Frame):
         :param lmbda: la longueur distance_element'onde (en m)
         :return: None
         """
-        self.initialisation_figure_angulaire()
-        axe = self.figure_secteur_angulaire.gca(polar=True)
-        for x, y, color in generer_secteur_angulaire(distance_element, lmbda) + calcul_phase_secteur_angulaire(
-                pas_de_phase_radians, distance_element,
-                lmbda):
-            axe.plot(x, y, color=color)
-        axe.set_title("dépointage")
-
-        self.canvas_secteur_angulaire.draw()
+        courbes = generer_secteur_angulaire(distance_element, lmbda) + calcul_phase_secteur_angulaire(
+            pas_de_phase_radians, distance_element, lmbda)
+        for ligne, (x, y, color) in zip(self.lignes_secteur_angulaire, courbes):
+            ligne.set_data(x, y)
+        self.rendu_secteur_angulaire.redessiner()
 
     def initialisation_figure_zone_visible(self) -> None:
         """
-        Initialise la figure pour la zone visible.
+        Crée une fois pour toutes les axes et les courbes de la figure de la zone visible.
         :return: None
         """
-        plotter = self.figure_zone_visible.gca()
-        plotter.clear()
+        plotter = self.figure_zone_visible.add_subplot()
         plotter.set_xlabel("psi (degrés)")
         plotter.set_ylabel("AF")
         plotter.set_title("zone visible")
+        # zoom
+        plotter.set_ylim(-40, 0)
+        # bornes du domaine visible, facteur de réseau, pas de phase et orientation de la cible
+        self.lignes_zone_visible = [plotter.plot([], [], color=color)[0]
+                                    for color in ("red", "red", "blue", "green", "orange")]
+        self.rendu_zone_visible = RenduBlit(self.canvas_zone_visible, self.lignes_zone_visible)
 
     def maj_figure_zone_visible(self, pas_de_phase_radians: float, distance_element: float, lmbda: float) -> None:
         """
@@ -317,7 +397,6 @@ class MainFrame(tk.Frame):
         :param lmbda: la longueur distance_element'onde (en m)
         :return: None
         """
-        self.initialisation_figure_zone_visible()
         amplitudes = (float(self.stringvar_ponderation_1.get()),
                       float(self.stringvar_ponderation_2.get()),
                       float(self.stringvar_ponderation_3.get()),
@@ -328,60 +407,83 @@ class MainFrame(tk.Frame):
             orientation_cible_radians) * 2 * np.pi * distance_element / lmbda + pas_de_phase_radians
         data = generer_zone_visible(pas_de_phase_radians, distance_element, lmbda, orientation_cible_radians,
                                     amplitudes=amplitudes)
-        axe = self.figure_zone_visible.gca()
-
-        # reprocessing data
-        borne_inf, borne_sup, courbe, origine, orientation_cible = data["data"]
-
-        # zoom
-        axe.set_ylim(-40, 0)
-        # axe.set_xlim(borne_inf[0][0]*180/np.pi, borne_sup[0][0]*180/np.pi)
-
-        for x, y, color in [borne_inf, borne_sup, courbe, origine, orientation_cible]:
-            axe.plot(x * 180 / np.pi, y, color=color)
-        self.canvas_zone_visible.draw()
+        for ligne, (x, y, color) in zip(self.lignes_zone_visible, data["data"]):
+            ligne.set_data(x * 180 / np.pi, y)
+        # l'axe des psi suit le domaine visible
+        axe = self.figure_zone_visible.axes[0]
+        axe.relim()
+        axe.autoscale_view(scaley=False)
+        self.rendu_zone_visible.redessiner()
 
     def initialisation_figure_signaux_generes(self) -> None:
         """
-        Initialise la figure pour les signaux générés.
+        Crée une fois pour toutes les axes et les courbes de la figure des signaux générés.
         :return: None
         """
-        axes = self.figure_signaux_generes.gca()
-        axes.clear()
+        axes = self.figure_signaux_generes.add_subplot()
         axes.set_xlabel("temps(s)")
         axes.set_ylabel("signaux numériques")
         axes.set_title("signaux générés numériquement")
-
-    def obtention_sinus_analogique(self, freq_ech_netbox=625e6, freq_ech=1000e6):
-        params = ((0, float(self.stringvar_ponderation_1.get()), float(self.stringvar_phase_1.get())),
-                  (1, float(self.stringvar_ponderation_2.get()), float(self.stringvar_phase_2.get())),
-                  (2, float(self.stringvar_ponderation_3.get()), float(self.stringvar_phase_3.get())),
-                  (3, float(self.stringvar_ponderation_4.get()), float(self.stringvar_phase_4.get())))
+        self.lignes_signaux_generes = [axes.plot([], [], label=f"voie {i + 1}")[0] for i in range(4)]
+        axes.legend()
+        self.rendu_signaux_generes = RenduBlit(self.canvas_signaux_generes, self.lignes_signaux_generes)
+        # signaux complets, dont seule la fenêtre visible est tracée ; déplacement et zoom par la barre d'outils
+        self.signaux_generes = None
+        axes.callbacks.connect("xlim_changed", self.maj_fenetre_signaux_generes)
+        self.barre_signaux_generes = NavigationToolbar2Tk(self.canvas_signaux_generes, self.main, pack_toolbar=False)
+
+    def parametres_voies(self, freq_ech_netbox=625e6, freq_ech=1000e6):
+        """
+        Lit les paramètres des voies saisis dans l'interface.
+        :return: fréquence RF (Hz), pondérations, phases (radians) et facteur de correction.
+        """
+        ponderations = [float(self.stringvar_ponderation_1.get()),
+                        float(self.stringvar_ponderation_2.get()),
+                        float(self.stringvar_ponderation_3.get()),
+                        float(self.stringvar_ponderation_4.get())]
+        phases_radians = [float(self.stringvar_phase_1.get()) * np.pi / 180,
+                          float(self.stringvar_phase_2.get()) * np.pi / 180,
+                          float(self.stringvar_phase_3.get()) * np.pi / 180,
+                          float(self.stringvar_phase_4.get()) * np.pi / 180]
 
         freq_rf = int(float(self.stringvar_frequence_rf.get()) * 1e6)
 
         # facteur de correction car l'echantillonnage se fait a 625MS/s mais on veut une meilleure précision
         facteur_correction = freq_ech / freq_ech_netbox
+        return freq_rf, ponderations, phases_radians, facteur_correction
+
+    def obtention_sinus_analogique(self, freq_ech_netbox=625e6, freq_ech=1000e6):
+        freq_rf, ponderations, phases_radians, facteur_correction = self.parametres_voies(freq_ech_netbox, freq_ech)
         periode = 1 / (freq_rf * facteur_correction)
-        courbes = []
-        for i, ponderation, phase in params:
-            temps, signal = calcul_sinus_analogique(freq_rf, ponderation, phase * np.pi / 180, facteur_correction)
-            courbes.append(signal)
-        return tuple([temps] + courbes + [periode])
+        courbes = synthese_voies(freq_rf, ponderations, phases_radians, facteur_correction)
+        return tuple([base_temps()] + list(courbes) + [periode])
 
     def maj_signaux_generes(self) -> None:
-        self.initialisation_figure_signaux_generes()
         data = self.obtention_sinus_analogique()
         temps = data[0]
         signaux = data[1:-1]
         periode = data[-1]
-        axe = self.figure_signaux_generes.gca()
-        for i, signal in enumerate(signaux):
-            axe.plot(temps, signal, label=f"voie {i + 1}")
+        self.signaux_generes = (temps, signaux)
+        # limites tirées des pondérations pour ne pas refaire le rendu complet à chaque changement de phase
+        amplitude = max(max(np.abs(self.parametres_voies()[1])), 1e-3) * 1.05
+        axe = self.figure_signaux_generes.axes[0]
         axe.set_xlim(0, periode)
-        axe.legend()
+        axe.set_ylim(-amplitude, amplitude)
+        self.maj_fenetre_signaux_generes(axe)
+        self.rendu_signaux_generes.redessiner()
 
-        self.canvas_signaux_generes.draw()
+    def maj_fenetre_signaux_generes(self, axe) -> None:
+        """
+        Retrace la fenêtre visible des signaux générés, sans nouvelle synthèse. Appelée aussi à chaque changement des
+        limites de l'axe (déplacement, zoom) ; le rendu est alors fait par la barre d'outils.
+        :return: None
+        """
+        if self.signaux_generes is None:
+            return
+        temps, signaux = self.signaux_generes
+        t_min, t_max = sorted(axe.get_xlim())
+        for ligne, signal in zip(self.lignes_signaux_generes, signaux):
+            ligne.set_data(*enveloppe_min_max(temps, signal, t_min, t_max, int(axe.bbox.width)))
 
     def maj_figures(self) -> None:
         """
@@ -395,6 +497,27 @@ class MainFrame(tk.Frame):
         self.maj_figure_angulaire(pas_de_phase_radians, distance_element, lmbda)
         self.maj_figure_zone_visible(pas_de_phase_radians, distance_element, lmbda)
         self.maj_signaux_generes()
+        self.figures_perimees = False
+
+    def planifier_maj_figures(self) -> None:
+        """
+        Programme la mise à jour des figures pour le moment où la boucle Tk sera libre. Les demandes rapprochées ne
+        donnent qu'une mise à jour ; si la fenêtre n'est pas visible, elle est reportée à son prochain affichage.
+        :return: None
+        """
+        self.figures_perimees = True
+        if self.maj_figures_planifiee is None and self.main.winfo_viewable():
+            self.maj_figures_planifiee = self.after_idle(self.maj_figures_differee)
+
+    def maj_figures_differee(self) -> None:
+        self.maj_figures_planifiee = None
+        if self.figures_perimees and self.main.winfo_viewable():
+            self.maj_figures()
+
+    def fenetre_affichee(self, event: tk.Event) -> None:
+        # fenêtre de nouveau visible : rattrapage des figures qui n'ont pas été redessinées
+        if event.widget is self.main and self.figures_perimees:
+            self.planifier_maj_figures()
 
     def initialisation_widgets(self) -> None:
         """
@@ -454,17 +577,14 @@ class MainFrame(tk.Frame):
         self.canvas_zone_visible.get_tk_widget().grid(row=13, column=0, columnspan=5, sticky="wens")
         self.canvas_secteur_angulaire.get_tk_widget().grid(row=13, column=4, columnspan=5, sticky="wens")
         self.canvas_signaux_generes.get_tk_widget().grid(row=13, column=9, columnspan=5, sticky="wens")
-
-    def process_buffer(self, pv_buffer):
-        pn_buffer = cast(pv_buffer, ptr16)
-        data = self.obtention_sinus_analogique()
-        signaux = data[1:-1]
-        # digitalisation des signaux
-        amplitude_max = 32768
-        signaux = [[int(amplitude_max * valeur) for valeur in signal] for signal in signaux]
-        valeurs_buffer = [x for x in chain.from_iterable([x for x in zip(*signaux)])]
-        for i, valeur in enumerate(valeurs_buffer):
-            pn_buffer[i] = valeur
+        self.barre_signaux_generes.grid(row=14, column=9, columnspan=5, sticky="wens")
+
+    def process_buffer(self, pv_buffer, taille_buffer, parametres=None):
+        # digitalisation des signaux directement dans le buffer DMA, entrelacés voie par voie
+        # hors du thread Tk, les paramètres sont lus à l'avance (parametres_voies) et passés en argument
+        pn_buffer = vue_buffer_int16(pv_buffer, taille_buffer)
+        freq_rf, ponderations, phases_radians, facteur_correction = parametres or self.parametres_voies()
+        synthese_entrelacee(pn_buffer, freq_rf, ponderations, phases_radians, facteur_correction)
         return pn_buffer
 
     def recuperation_niveaux(self):
@@ -484,26 +604,47 @@ class MainFrame(tk.Frame):
         niveaux = [borne_niveau(niveau) for niveau in niveaux]
         return niveaux
 
+    def relever_travailleur(self):
+        self.travailleur.distribuer_resultats()
+        self.after(PERIODE_RELEVE_MS, self.relever_travailleur)
+
     def start_signaux(self):
-        self.maj_figures()
-        carte = ouverture_carte("169.254.114.9", 0)
-        type_carte = check_card(carte)
-        init_vitesse_sampling(type_carte, carte)
-        taille_buffer = init_canaux(carte, filtres=bool(int(self.stringvar_filtres_netbox.get())))
+        # les paramètres sont lus dans le thread Tk, la carte est pilotée par le travailleur ; des clics rapprochés
+        # sur "générer" ou "stopper" ne donnent qu'une opération, la dernière demandée
         # niveaux = self.recuperation_niveaux()
-        maj_amplitude(carte)
-        pv_buffer = init_buffer(carte, taille_buffer)
-        pn_buffer = self.process_buffer(pv_buffer)
-        transfert_netbox(carte, pv_buffer, taille_buffer)
-        start(carte, timeout=True, timeout_duration=10000, exit_on_timeout=True)
-        print("actif")
-        fermeture_carte(carte)
+        filtres = bool(int(self.stringvar_filtres_netbox.get()))
+        freq_rf, ponderations, phases_radians, facteur_correction = self.parametres_voies()
+
+        def envoi():
+            if self.faisceau is None:
+                self.faisceau = FaisceauCarte(self.session, freq_rf, ponderations, phases_radians, facteur_correction,
+                                              filtres=filtres)
+                self.faisceau.emettre()
+            else:
+                self.faisceau.maj(ponderations, phases_radians, freq_signal=freq_rf, filtres=filtres)
+            return self.session.backend.appels_evites
+
+        self.travailleur.soumettre(envoi, rappel=self.signaux_actifs, cle="signaux")
+
+    def signaux_actifs(self, appels_evites, erreur):
+        # les signaux sont sur la carte : les figures sont redessinées ensuite, quand Tk est libre
+        if erreur is not None:
+            print(f"échec de la génération des signaux: {erreur}")
+            return
+        print(f"actif (écritures de registres évitées: {appels_evites})")
+        self.planifier_maj_figures()
 
     def stop_signaux(self):
-        carte = ouverture_carte("169.254.114.9", 0)
-        stop(carte)
-        fermeture_carte(carte)
-        print("inactif")
+        def arret():
+            if self.faisceau is None:
+                self.session.arreter()
+            else:
+                self.faisceau.arreter()
+
+        self.travailleur.soumettre(arret, rappel=self.signaux_inactifs, cle="signaux")
+
+    def signaux_inactifs(self, resultat, erreur):
+        print("inactif" if erreur is None else f"échec de l'arrêt des signaux: {erreur}")
 
 
 if __name__ == "__main__":
@@ -512,5 +653,7 @@ if __name__ == "__main__":
     main_frame = MainFrame(main)
     main_frame.grid()
     main.mainloop()
+    main_frame.travailleur.arreter()
+    main_frame.session.fermer()
 # todo: basculer le gestionnaire de position sur grid au lieu de pack
 # todo: commenter le code
@@ -1,6 +1,5 @@
 import os
-import platform
-import sys 
+import threading
 from ctypes import *
 
 # load registers for easier access
@@ -17,9 +16,8 @@ SPCM_BUF_ABA       = 2000 # buffer for ABA data, holds the A-DATA (slow samples)
 SPCM_BUF_TIMESTAMP = 3000 # buffer for timestamps
 
 
-# determine bit width of os
-oPlatform = platform.architecture()
-if (oPlatform[0] == '64bit'):
+# determine bit width of the python interpreter (and so of the driver library to load)
+if (sizeof (c_void_p) == 8):
     bIs64Bit = 1
 else:
     bIs64Bit = 0
@@ -46,180 +44,103 @@ uptr32 = POINTER (uint32)
 uptr64 = POINTER (uint64)
 
 
-# Windows
-if os.name == 'nt':
-    sys.stdout.write("Python Version: {0} on Windows\n\n".format (platform.python_version()))
-
-    # define card handle type
-    if (bIs64Bit):
-        # for unknown reasons c_void_p gets messed up on Win7/64bit, but this works:
-        drv_handle = POINTER(c_uint64)
-    else:
-        drv_handle = c_void_p
-
-    # Load DLL into memory.
-    # use windll because all driver access functions use _stdcall calling convention under windows
-    if (bIs64Bit == 1):
-        spcmDll = windll.LoadLibrary ("c:\\windows\\system32\\spcm_win64.dll")
-    else:
-        spcmDll = windll.LoadLibrary ("c:\\windows\\system32\\spcm_win32.dll")
-
-    # load spcm_hOpen
-    if (bIs64Bit):
-        spcm_hOpen = getattr (spcmDll, "spcm_hOpen")
-    else:
-        spcm_hOpen = getattr (spcmDll, "_spcm_hOpen@4")
-    spcm_hOpen.argtype = [c_char_p]
-    spcm_hOpen.restype = drv_handle 
-
-    # load spcm_vClose
-    if (bIs64Bit):
-        spcm_vClose = getattr (spcmDll, "spcm_vClose")
-    else:
-        spcm_vClose = getattr (spcmDll, "_spcm_vClose@4")
-    spcm_vClose.argtype = [drv_handle]
-    spcm_vClose.restype = None
-
-    # load spcm_dwGetErrorInfo
-    if (bIs64Bit):
-        spcm_dwGetErrorInfo_i32 = getattr (spcmDll, "spcm_dwGetErrorInfo_i32")
-    else:
-        spcm_dwGetErrorInfo_i32 = getattr (spcmDll, "_spcm_dwGetErrorInfo_i32@16")
-    spcm_dwGetErrorInfo_i32.argtype = [drv_handle, uptr32, ptr32, c_char_p]
-    spcm_dwGetErrorInfo_i32.restype = uint32
-
-    # load spcm_dwGetParam_i32
-    if (bIs64Bit):
-        spcm_dwGetParam_i32 = getattr (spcmDll, "spcm_dwGetParam_i32")
-    else:
-        spcm_dwGetParam_i32 = getattr (spcmDll, "_spcm_dwGetParam_i32@12")
-    spcm_dwGetParam_i32.argtype = [drv_handle, int32, ptr32]
-    spcm_dwGetParam_i32.restype = uint32
-
-    # load spcm_dwGetParam_i64
-    if (bIs64Bit):
-        spcm_dwGetParam_i64 = getattr (spcmDll, "spcm_dwGetParam_i64")
-    else:
-        spcm_dwGetParam_i64 = getattr (spcmDll, "_spcm_dwGetParam_i64@12")
-    spcm_dwGetParam_i64.argtype = [drv_handle, int32, ptr64]
-    spcm_dwGetParam_i64.restype = uint32
-
-    # load spcm_dwSetParam_i32
-    if (bIs64Bit):
-        spcm_dwSetParam_i32 = getattr (spcmDll, "spcm_dwSetParam_i32")
-    else:
-        spcm_dwSetParam_i32 = getattr (spcmDll, "_spcm_dwSetParam_i32@12")
-    spcm_dwSetParam_i32.argtype = [drv_handle, int32, int32]
-    spcm_dwSetParam_i32.restype = uint32
-
-    # load spcm_dwSetParam_i64
-    if (bIs64Bit):
-        spcm_dwSetParam_i64 = getattr (spcmDll, "spcm_dwSetParam_i64")
-    else:
-        spcm_dwSetParam_i64 = getattr (spcmDll, "_spcm_dwSetParam_i64@16")
-    spcm_dwSetParam_i64.argtype = [drv_handle, int32, int64]
-    spcm_dwSetParam_i64.restype = uint32
-
-    # load spcm_dwSetParam_i64m
-    if (bIs64Bit):
-        spcm_dwSetParam_i64m = getattr (spcmDll, "spcm_dwSetParam_i64m")
-    else:
-        spcm_dwSetParam_i64m = getattr (spcmDll, "_spcm_dwSetParam_i64m@16")
-    spcm_dwSetParam_i64m.argtype = [drv_handle, int32, int32, int32]
-    spcm_dwSetParam_i64m.restype = uint32
-
-    # load spcm_dwDefTransfer_i64
-    if (bIs64Bit):
-        spcm_dwDefTransfer_i64 = getattr (spcmDll, "spcm_dwDefTransfer_i64")
-    else:
-        spcm_dwDefTransfer_i64 = getattr (spcmDll, "_spcm_dwDefTransfer_i64@36")
-    spcm_dwDefTransfer_i64.argtype = [drv_handle, uint32, uint32, uint32, c_void_p, uint64, uint64]
-    spcm_dwDefTransfer_i64.restype = uint32
-
-    # load spcm_dwInvalidateBuf
-    if (bIs64Bit):
-        spcm_dwInvalidateBuf = getattr (spcmDll, "spcm_dwInvalidateBuf")
-    else:
-        spcm_dwInvalidateBuf = getattr (spcmDll, "_spcm_dwInvalidateBuf@8")
-    spcm_dwInvalidateBuf.argtype = [drv_handle, uint32]
-    spcm_dwInvalidateBuf.restype = uint32
-
-    # load spcm_dwGetContBuf_i64
-    if (bIs64Bit):
-        spcm_dwGetContBuf_i64 = getattr (spcmDll, "spcm_dwGetContBuf_i64")
-    else:
-        spcm_dwGetContBuf_i64 = getattr (spcmDll, "_spcm_dwGetContBuf_i64@16")
-    spcm_dwGetContBuf_i64.argtype = [drv_handle, uint32, POINTER(c_void_p), uptr64]
-    spcm_dwGetContBuf_i64.restype = uint32
-
-
-elif os.name == 'posix':
-    sys.stdout.write("Python Version: {0} on Linux\n\n".format (platform.python_version()))
-
-    # define card handle type
-    if (bIs64Bit):
-        drv_handle = POINTER(c_uint64)
-    else:
-        drv_handle = c_void_p
-
-    # Load DLL into memory.
-    # use cdll because all driver access functions use cdecl calling convention under linux 
-    spcmDll = cdll.LoadLibrary ("libspcm_linux.so")
-
-    # load spcm_hOpen
-    spcm_hOpen = getattr (spcmDll, "spcm_hOpen")
-    spcm_hOpen.argtype = [c_char_p]
-    spcm_hOpen.restype = drv_handle 
-
-    # load spcm_vClose
-    spcm_vClose = getattr (spcmDll, "spcm_vClose")
-    spcm_vClose.argtype = [drv_handle]
-    spcm_vClose.restype = None
-
-    # load spcm_dwGetErrorInfo
-    spcm_dwGetErrorInfo_i32 = getattr (spcmDll, "spcm_dwGetErrorInfo_i32")
-    spcm_dwGetErrorInfo_i32.argtype = [drv_handle, uptr32, ptr32, c_char_p]
-    spcm_dwGetErrorInfo_i32.restype = uint32
-
-    # load spcm_dwGetParam_i32
-    spcm_dwGetParam_i32 = getattr (spcmDll, "spcm_dwGetParam_i32")
-    spcm_dwGetParam_i32.argtype = [drv_handle, int32, ptr32]
-    spcm_dwGetParam_i32.restype = uint32
-
-    # load spcm_dwGetParam_i64
-    spcm_dwGetParam_i64 = getattr (spcmDll, "spcm_dwGetParam_i64")
-    spcm_dwGetParam_i64.argtype = [drv_handle, int32, ptr64]
-    spcm_dwGetParam_i64.restype = uint32
-
-    # load spcm_dwSetParam_i32
-    spcm_dwSetParam_i32 = getattr (spcmDll, "spcm_dwSetParam_i32")
-    spcm_dwSetParam_i32.argtype = [drv_handle, int32, int32]
-    spcm_dwSetParam_i32.restype = uint32
-
-    # load spcm_dwSetParam_i64
-    spcm_dwSetParam_i64 = getattr (spcmDll, "spcm_dwSetParam_i64")
-    spcm_dwSetParam_i64.argtype = [drv_handle, int32, int64]
-    spcm_dwSetParam_i64.restype = uint32
-
-    # load spcm_dwSetParam_i64m
-    spcm_dwSetParam_i64m = getattr (spcmDll, "spcm_dwSetParam_i64m")
-    spcm_dwSetParam_i64m.argtype = [drv_handle, int32, int32, int32]
-    spcm_dwSetParam_i64m.restype = uint32
-
-    # load spcm_dwDefTransfer_i64
-    spcm_dwDefTransfer_i64 = getattr (spcmDll, "spcm_dwDefTransfer_i64")
-    spcm_dwDefTransfer_i64.argtype = [drv_handle, uint32, uint32, uint32, c_void_p, uint64, uint64]
-    spcm_dwDefTransfer_i64.restype = uint32
-
-    # load spcm_dwInvalidateBuf
-    spcm_dwInvalidateBuf = getattr (spcmDll, "spcm_dwInvalidateBuf")
-    spcm_dwInvalidateBuf.argtype = [drv_handle, uint32]
-    spcm_dwInvalidateBuf.restype = uint32
-
-    # load spcm_dwGetContBuf_i64
-    spcm_dwGetContBuf_i64 = getattr (spcmDll, "spcm_dwGetContBuf_i64")
-    spcm_dwGetContBuf_i64.argtype = [drv_handle, uint32, POINTER(c_void_p), uptr64]
-    spcm_dwGetContBuf_i64.restype = uint32
+# stands in for the driver library when it cannot be loaded (no Spectrum driver installed):
+# the module still imports, so that a simulated backend can be used, and calling any driver function raises OSError
+class _MissingDriver:
+    def __init__ (self, sName, oError):
+        self._sName = sName
+        self._oError = oError
 
+    def __getattr__ (self, sFunction):
+        sName, oError = self._sName, self._oError
+        def missing (*args):
+            raise OSError ("{0}: Spectrum driver {1} could not be loaded ({2})".format (sFunction, sName, oError))
+        missing.__name__ = sFunction
+        return missing
+
+def _loadDriver (oLoader, sName):
+    try:
+        return oLoader.LoadLibrary (sName)
+    except OSError as oError:
+        return _MissingDriver (sName, oError)
+
+
+# define card handle type
+if (bIs64Bit):
+    # for unknown reasons c_void_p gets messed up on Win7/64bit, but this works:
+    drv_handle = POINTER(c_uint64)
 else:
-    raise Exception ('Operating system not supported by pySpcm')
+    drv_handle = c_void_p
+
+
+# driver entry points with their prototypes: name, argument types, return type.
+# The same table serves Windows and Linux. On 32 bit Windows the functions use the stdcall convention and are
+# exported under a decorated name "_name@n", n being the size of the arguments on the stack (see _sExportName).
+tDriverFunctions = (
+    ("spcm_hOpen",              [c_char_p],                                                    drv_handle),
+    ("spcm_vClose",             [drv_handle],                                                  None),
+    ("spcm_dwGetErrorInfo_i32", [drv_handle, uptr32, ptr32, c_char_p],                         uint32),
+    ("spcm_dwGetParam_i32",     [drv_handle, int32, ptr32],                                    uint32),
+    ("spcm_dwGetParam_i64",     [drv_handle, int32, ptr64],                                    uint32),
+    ("spcm_dwSetParam_i32",     [drv_handle, int32, int32],                                    uint32),
+    ("spcm_dwSetParam_i64",     [drv_handle, int32, int64],                                    uint32),
+    ("spcm_dwSetParam_i64m",    [drv_handle, int32, int32, uint32],                            uint32),
+    ("spcm_dwDefTransfer_i64",  [drv_handle, uint32, uint32, uint32, c_void_p, uint64, uint64], uint32),
+    ("spcm_dwInvalidateBuf",    [drv_handle, uint32],                                          uint32),
+    ("spcm_dwGetContBuf_i64",   [drv_handle, uint32, POINTER(c_void_p), uptr64],               uint32),
+)
+
+# The driver library is loaded on first access to one of the names below (module __getattr__, PEP 562), not at
+# import: importing pyspcm has no side effect and only costs the register definitions. Once loaded, the functions
+# are plain module globals and __getattr__ is no longer involved in the calls.
+tDriverNames = tuple (sName for sName, lArgTypes, oResType in tDriverFunctions)
+
+_oDriverLock = threading.Lock ()
+
+def _sExportName (sName, lArgTypes):
+    # stdcall name decoration of 32 bit windows, each argument takes at least one 4 bytes stack slot:
+    # spcm_dwSetParam_i64 (drv_handle, int32, int64) -> _spcm_dwSetParam_i64@16
+    if os.name == 'nt' and not bIs64Bit:
+        return "_{0}@{1}".format (sName, sum (max (sizeof (oType), 4) for oType in lArgTypes))
+    return sName
+
+def _initDriver ():
+    global spcmDll, bDriverLoaded
+
+    with _oDriverLock:
+        if "spcmDll" in globals ():
+            return
+
+        # Windows
+        # use windll because all driver access functions use _stdcall calling convention under windows
+        if os.name == 'nt':
+            if (bIs64Bit == 1):
+                oDll = _loadDriver (windll, "c:\\windows\\system32\\spcm_win64.dll")
+            else:
+                oDll = _loadDriver (windll, "c:\\windows\\system32\\spcm_win32.dll")
+
+        # Linux
+        # use cdll because all driver access functions use cdecl calling convention under linux
+        elif os.name == 'posix':
+            oDll = _loadDriver (cdll, "libspcm_linux.so")
+
+        else:
+            raise Exception ('Operating system not supported by pySpcm')
+
+        # argtypes (plural) make ctypes check and convert every argument to the C type of the prototype: without
+        # them a python int is passed as a C int and 64 bit values are truncated
+        for sName, lArgTypes, oResType in tDriverFunctions:
+            oFunction = getattr (oDll, _sExportName (sName, lArgTypes))
+            oFunction.argtypes = lArgTypes
+            oFunction.restype = oResType
+            globals ()[sName] = oFunction
+
+        # false when the functions above are placeholders raising OSError
+        bDriverLoaded = not isinstance (oDll, _MissingDriver)
+        spcmDll = oDll
+
+def __getattr__ (sName):
+    if sName in tDriverNames or sName in ("spcmDll", "bDriverLoaded"):
+        _initDriver ()
+        return globals ()[sName]
+    raise AttributeError ("module {0!r} has no attribute {1!r}".format (__name__, sName))
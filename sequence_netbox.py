@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Saut de faisceau en mode séquence (SPC_REP_STD_SEQUENCE).
+
+Les K faisceaux utiles sont chargés une fois pour toutes dans autant de segments de la mémoire de la carte. La
+séquence ne comporte qu'une étape, qui boucle sur elle-même en rejouant le segment du faisceau courant : changer de
+faisceau revient à réécrire cette étape (SPC_SEQMODE_STEPMEM0), soit une seule écriture de registre au lieu d'un
+transfert DMA complet. La carte bascule à la fin du segment en cours de rejeu, sans interrompre la sortie.
+"""
+from netbox_api import *
+
+
+def entree_sequence(segment, etape_suivante, boucles=1, drapeaux=SPCSEQ_ENDLOOPALWAYS):
+    # mot de 64 bits d'une étape : boucles et drapeaux de fin sur les 32 bits hauts, étape suivante et segment sur
+    # les 32 bits bas
+    haut = (boucles & SPCSEQ_LOOPMASK) | (drapeaux & 0xFFFFFFFF)
+    bas = ((etape_suivante << 16) & SPCSEQ_NEXTSTEPMASK & 0xFFFFFFFF) | (segment & SPCSEQ_SEGMENTMASK)
+    return (haut << 32) | bas
+
+
+def init_sequence(hcard, n_segments, channels=CHANNEL0 | CHANNEL1 | CHANNEL2 | CHANNEL3, filtres=True, backend=None):
+    # le nombre de segments de la carte doit être une puissance de 2
+    backend = pilote(backend)
+    max_segments = 1 << max(n_segments - 1, 0).bit_length()
+    backend.spcm_dwSetParam_i32(hcard, SPC_CARDMODE, SPC_REP_STD_SEQUENCE)
+    backend.spcm_dwSetParam_i64(hcard, SPC_CHENABLE, channels)
+    backend.spcm_dwSetParam_i32(hcard, SPC_SEQMODE_MAXSEGMENTS, max_segments)
+    backend.spcm_dwSetParam_i32(hcard, SPC_SEQMODE_STARTSTEP, 0)
+    init_sorties(hcard, filtres, channels, backend=backend)
+    return format_echantillons(hcard, backend=backend)
+
+
+def ecriture_segment(hcard, segment, pvBuffer, buffSize, echantillons, backend=None):
+    # sélection du segment puis transfert de ses données dans la mémoire de la carte
+    backend = pilote(backend)
+    backend.spcm_dwSetParam_i32(hcard, SPC_SEQMODE_WRITESEGMENT, segment)
+    backend.spcm_dwSetParam_i32(hcard, SPC_SEQMODE_SEGMENTSIZE, echantillons)
+    return transfert_netbox(hcard, pvBuffer, buffSize, backend=backend)
+
+
+class SequenceFaisceaux:
+    """
+    Faisceaux chargés en segments de la mémoire de la carte et sélectionnés par une écriture de registre.
+    """
+
+    def __init__(self, session, echantillons_segment=KILO_B(64), filtres=True, level=2000):
+        """
+        :param session: CardSession de la carte à piloter.
+        :param echantillons_segment: nombre d'échantillons par voie dans chaque segment.
+        :param filtres: active les filtres des sorties.
+        :param level: amplitude des sorties (mV).
+        """
+        self.session = session
+        self.echantillons_segment = echantillons_segment
+        self.filtres = filtres
+        self.level = level
+        self.n_segments = 0
+        self.segment_courant = None
+        self.pv_buffer = None
+        self.taille_segment = 0
+
+    def charger(self, remplissages):
+        """
+        Configure la carte en mode séquence et charge un segment par faisceau. Chaque élément de `remplissages` est
+        appelé avec (pv_buffer, taille_buffer) pour remplir le buffer du segment, comme pour CardSession.transferer
+        (par exemple CodebookFaisceaux.remplissage(angle)). Le faisceau 0 est sélectionné.
+        """
+        remplissages = list(remplissages)
+        self.session.executer(self._charger, remplissages)
+
+    def _charger(self, hcard, remplissages):
+        backend = self.session.backend
+        # la configuration du mode standard n'est plus celle de la carte
+        self.session.configuration = None
+        n_voies, octets = init_sequence(hcard, len(remplissages), filtres=self.filtres, backend=backend)
+        maj_amplitude(hcard, self.level, backend=backend)
+        taille_segment = self.echantillons_segment * n_voies * octets
+        if self.pv_buffer is None or self.taille_segment != taille_segment:
+            self.pv_buffer = pvAllocMemPageAligned(taille_segment)
+            self.taille_segment = taille_segment
+        for segment, remplissage in enumerate(remplissages):
+            remplissage(self.pv_buffer, taille_segment)
+            self.session.verifier(ecriture_segment(hcard, segment, self.pv_buffer, taille_segment,
+                                                   self.echantillons_segment, backend=backend))
+        self.n_segments = len(remplissages)
+        self.segment_courant = None
+        self._selectionner(hcard, 0)
+
+    def selectionner(self, segment):
+        """
+        Passe sur le faisceau du segment demandé : une seule écriture de registre, prise en compte à la fin du segment
+        en cours de rejeu.
+        """
+        if not 0 <= segment < self.n_segments:
+            raise IndexError(f"segment {segment} non chargé ({self.n_segments} segments)")
+        if segment != self.segment_courant:
+            self.session.executer(self._selectionner, segment)
+
+    def _selectionner(self, hcard, segment):
+        # l'étape 0 rejoue le segment une fois puis revient sur elle-même
+        self.session.verifier(self.session.backend.spcm_dwSetParam_i64(hcard, SPC_SEQMODE_STEPMEM0,
+                                                                       entree_sequence(segment, 0)))
+        self.segment_courant = segment
+
+    def demarrer(self, timeout_duration=10000):
+        self.session.demarrer(timeout_duration)
+
+    def arreter(self):
+        self.session.arreter()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Carte simulée : backend sans pilote ni netbox pour mesurer et tester le débit de toute la chaîne.
+
+CarteSimulee reprend les registres et le modèle FIFO de MockBackend et y ajoute le coût du lien avec la netbox : une
+latence fixe par appel au pilote (aller-retour TCP/IP) et un débit limité pour les transferts DMA. Les données
+transférées sont capturées sous forme de tableaux NumPy (échantillons x voies) pour être comparées à celles attendues.
+
+Sélection sans modifier le code : SPCM_BACKEND=simule, ou netbox_api.choisir_backend(CarteSimulee(...)).
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from netbox_api import *
+
+
+class CarteSimulee(MockBackend):
+    """
+    Carte M4i simulée avec latence par appel, débit de transfert et capture des buffers envoyés.
+    """
+
+    def __init__(self, latence=0.0005, debit=100e6, temps_reel=False, captures_max=16, journal_max=10000,
+                 **kwargs):
+        """
+        :param latence: durée d'un aller-retour avec la netbox (s), ajoutée à chaque appel au pilote.
+        :param debit: débit du lien avec la netbox pour les transferts DMA (octets/s), None pour un débit infini.
+        :param temps_reel: en mode FIFO, la carte consomme les blocs au rythme de sa fréquence d'échantillonnage au
+            lieu de les consommer instantanément.
+        :param captures_max: nombre de buffers transférés conservés dans `sorties`, les plus anciens sont oubliés.
+        :param journal_max: nombre d'appels conservés dans `appels`.
+        :param kwargs: paramètres de MockBackend (card_type, serial_number, echecs_ouverture).
+        """
+        super().__init__(**kwargs)
+        self.latence = latence
+        self.debit = debit
+        self.temps_reel = temps_reel
+        self.appels = deque(maxlen=journal_max)
+        self.transferts = deque(maxlen=1)
+        self.sorties = deque(maxlen=captures_max)
+        self.verrou = threading.Lock()
+        self.n_appels = 0
+        self.octets_transferes = 0
+        self.transferts_dma = 0
+        self.blocs_consommes = 0
+
+    def statistiques(self):
+        return {"appels": self.n_appels, "octets_transferes": self.octets_transferes,
+                "transferts_dma": self.transferts_dma, "blocs_consommes": self.blocs_consommes}
+
+    def _attendre(self, duree):
+        if duree:
+            time.sleep(duree)
+
+    def _appel(self, nom, hcard, *args):
+        self._attendre(self.latence)
+        with self.verrou:
+            self.n_appels += 1
+        return super()._appel(nom, hcard, *args)
+
+    def spcm_hOpen(self, address):
+        self._attendre(self.latence)
+        return super().spcm_hOpen(address)
+
+    @property
+    def n_voies(self):
+        return max(bin(self.registres.get(SPC_CHENABLE, 0)).count("1"), 1)
+
+    def _capturer(self, donnees):
+        # copie des échantillons envoyés, rangés par voie
+        n_voies = self.n_voies
+        donnees = np.array(donnees, dtype=np.int16)
+        self.sorties.append(donnees.reshape(-1, n_voies) if donnees.size % n_voies == 0 else donnees)
+
+    def _dma(self, pv_buffer, offset, longueur):
+        self._attendre(longueur / self.debit if self.debit else 0)
+        self._capturer(vue_buffer_int16(pv_buffer, longueur))
+        with self.verrou:
+            self.octets_transferes += longueur
+            self.transferts_dma += 1
+
+    def _consommer(self):
+        fifo = self.fifo
+        pv_buffer = self.transferts[-1][0]
+        debut, longueur = super()._consommer()
+        if not longueur:
+            return debut, longueur
+        duree = longueur / self.debit if self.debit else 0
+        if self.temps_reel:
+            duree = max(duree, longueur / (2 * self.n_voies * self.registres.get(SPC_SAMPLERATE, MEGA(625))))
+        self._attendre(duree)
+        # le bloc peut être à cheval sur la fin de l'anneau
+        anneau = vue_buffer_int16(pv_buffer, fifo["taille"])
+        self._capturer(np.take(anneau, np.arange(debut // 2, (debut + longueur) // 2), mode="wrap"))
+        with self.verrou:
+            self.octets_transferes += longueur
+            self.blocs_consommes += 1
+        return debut, longueur
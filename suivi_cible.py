@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+Suivi en temps réel d'un terminal à partir d'un flux de positions.
+
+Les angles de la cible (degrés, une mesure par ligne : "angle" ou "horodatage angle", horodatage en secondes depuis
+l'epoch) sont lus sur un socket UDP local ou dans un fichier (fichier suivi en continu, tube nommé, entrée standard).
+Un filtre alpha-bêta estime l'angle et la vitesse angulaire de la cible ; la boucle de poussée tourne à fréquence
+bornée et envoie à la carte l'angle prédit pour l'instant où le faisceau sera effectivement appliqué, y compris entre
+deux mesures. Les changements plus petits que la zone morte ne sont pas envoyés.
+
+Le faisceau est appliqué par le chemin le plus rapide disponible (pousseur_le_plus_rapide) :
+- mode séquence avec un segment par angle du codebook : une écriture de registre ;
+- flux FIFO : nouvelles phases prises en compte au bloc suivant, sans arrêter la carte ;
+- codebook : arrêt de la carte, copie du buffer précalculé, transfert DMA puis redémarrage ;
+- à défaut, synthèse des seules voies modifiées puis transfert DMA (FaisceauCarte).
+En mode standard, la carte refuse un transfert et un démarrage pendant le rejeu (ERR_RUNNING) : les deux derniers
+chemins l'arrêtent avant chaque transfert.
+
+La latence de bout en bout (réception ou horodatage de la mesure jusqu'à la fin de la poussée) et la fréquence de mise
+à jour sont relevées dans `statistiques()`.
+
+Exemple : python suivi_cible.py --port 5005 --freq-rf 75e6 --distance 0.11 --lmbda 0.0838
+"""
+import argparse
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from codebook_faisceaux import pas_de_phase_pour_angle, phases_voies
+
+Mesure = Tuple[Optional[float], float]  # (horodatage ou None, angle en degrés)
+
+
+def lecture_mesure(ligne: str) -> Optional[Mesure]:
+    """
+    Décode une ligne "angle" ou "horodatage angle". Les lignes vides, commentées (#) ou invalides sont ignorées.
+    """
+    champs = ligne.replace(",", " ").split()
+    if not champs or champs[0].startswith("#"):
+        return None
+    try:
+        valeurs = [float(champ) for champ in champs[:2]]
+    except ValueError:
+        return None
+    return (None, valeurs[0]) if len(valeurs) == 1 else (valeurs[0], valeurs[1])
+
+
+def flux_fichier(chemin: str, arret: threading.Event, suivre: bool = True, attente: float = 0.005) -> Iterator[str]:
+    """
+    Lignes d'un fichier ; avec suivre, attend les lignes ajoutées ensuite (comme tail -f). Convient aussi aux tubes
+    nommés et à "-" pour l'entrée standard.
+    """
+    fichier = sys.stdin if chemin == "-" else open(chemin, encoding="utf-8")
+    try:
+        while not arret.is_set():
+            ligne = fichier.readline()
+            if ligne:
+                yield ligne
+            elif suivre:
+                time.sleep(attente)
+            else:
+                return
+    finally:
+        if fichier is not sys.stdin:
+            fichier.close()
+
+
+def flux_udp(port: int, arret: threading.Event, hote: str = "127.0.0.1") -> Iterator[str]:
+    """
+    Lignes reçues sur un socket UDP local, un ou plusieurs lignes par datagramme.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((hote, port))
+        sock.settimeout(0.1)
+        while not arret.is_set():
+            try:
+                donnees = sock.recv(4096)
+            except socket.timeout:
+                continue
+            yield from donnees.decode("utf-8", errors="replace").splitlines()
+
+
+class PredicteurAngle:
+    """
+    Filtre alpha-bêta : angle et vitesse angulaire de la cible, extrapolés entre deux mesures.
+    """
+
+    def __init__(self, alpha: float = 0.6, beta: float = 0.2, extrapolation_max: float = 0.5) -> None:
+        """
+        :param alpha: gain sur l'angle.
+        :param beta: gain sur la vitesse angulaire.
+        :param extrapolation_max: durée (s) au-delà de la dernière mesure pendant laquelle la prédiction avance
+            encore ; ensuite l'angle est figé.
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.extrapolation_max = extrapolation_max
+        self.instant = None
+        self.angle = None
+        self.vitesse = 0.0
+
+    def mettre_a_jour(self, instant: float, angle: float) -> None:
+        if self.instant is None:
+            self.instant, self.angle = instant, angle
+            return
+        dt = instant - self.instant
+        if dt <= 0:
+            self.angle = angle
+            return
+        prediction = self.angle + self.vitesse * dt
+        residu = angle - prediction
+        self.angle = prediction + self.alpha * residu
+        self.vitesse += self.beta * residu / dt
+        self.instant = instant
+
+    def predire(self, instant: float) -> Optional[float]:
+        if self.instant is None:
+            return None
+        return self.angle + self.vitesse * min(max(instant - self.instant, 0.0), self.extrapolation_max)
+
+
+class PousseurSequence:
+    """
+    Faisceaux déjà chargés en segments (SequenceFaisceaux), un par angle de la grille : une écriture de registre.
+    """
+
+    def __init__(self, sequence, angles_radians: Sequence[float]) -> None:
+        if angles_radians is None:
+            raise ValueError("angles_radians est requis : angle du faisceau chargé dans chaque segment")
+        self.sequence = sequence
+        self.angles_radians = np.asarray(angles_radians, dtype=np.float64)
+        if self.angles_radians.size != sequence.n_segments:
+            raise ValueError(f"{self.angles_radians.size} angles pour {sequence.n_segments} segments chargés")
+
+    def __call__(self, angle_radians: float) -> float:
+        indice = int(np.abs(self.angles_radians - angle_radians).argmin())
+        self.sequence.selectionner(indice)
+        return float(self.angles_radians[indice])
+
+
+class PousseurFifo:
+    """
+    Flux FIFO en cours (FluxFifo) : nouvelles phases appliquées au prochain bloc.
+    """
+
+    def __init__(self, flux, distance_element: float, lmbda: float, n_voies: int = 4) -> None:
+        self.flux = flux
+        self.distance_element = distance_element
+        self.lmbda = lmbda
+        self.n_voies = n_voies
+
+    def __call__(self, angle_radians: float) -> float:
+        pas = pas_de_phase_pour_angle(angle_radians, self.distance_element, self.lmbda)
+        self.flux.maj_faisceau(phases_radians=phases_voies(pas, self.n_voies))
+        return angle_radians
+
+
+class PousseurCodebook:
+    """
+    Buffer précalculé (CodebookFaisceaux) copié dans le buffer DMA puis transféré, carte arrêtée.
+    """
+
+    def __init__(self, session, codebook, timeout_duration: int = 10000) -> None:
+        self.session = session
+        self.codebook = codebook
+        self.timeout_duration = timeout_duration
+        self.en_marche = False
+
+    def __call__(self, angle_radians: float) -> float:
+        angle_grille = float(self.codebook.angles_radians[self.codebook.indice(angle_radians)])
+        if self.en_marche:
+            self.session.arreter()
+            self.en_marche = False
+        self.session.transferer(self.codebook.remplissage(angle_grille))
+        self.session.demarrer(self.timeout_duration)
+        self.en_marche = True
+        return angle_grille
+
+
+class PousseurSynthese:
+    """
+    Synthèse des signaux dans le buffer DMA puis transfert : chemin le plus lent, toujours disponible. Le faisceau est
+    mis à jour par FaisceauCarte, qui arrête la carte avant le transfert et ne resynthétise que les voies modifiées.
+    """
+
+    def __init__(self, session, freq_rf: float, distance_element: float, lmbda: float,
+                 ponderations: Sequence[float] = (1, 1, 1, 1), facteur_correction: float = 1.6,
+                 timeout_duration: int = 10000) -> None:
+        self.session = session
+        self.freq_rf = freq_rf
+        self.distance_element = distance_element
+        self.lmbda = lmbda
+        self.ponderations = tuple(ponderations)
+        self.facteur_correction = facteur_correction
+        self.timeout_duration = timeout_duration
+        self.faisceau = None
+
+    def __call__(self, angle_radians: float) -> float:
+        pas = pas_de_phase_pour_angle(angle_radians, self.distance_element, self.lmbda)
+        phases = phases_voies(pas, len(self.ponderations))
+        if self.faisceau is None:
+            from faisceau_carte import FaisceauCarte
+            self.faisceau = FaisceauCarte(self.session, self.freq_rf, self.ponderations, phases,
+                                          self.facteur_correction, timeout_duration=self.timeout_duration)
+            self.faisceau.emettre()
+        else:
+            self.faisceau.maj(phases_radians=phases)
+        return angle_radians
+
+
+def pousseur_le_plus_rapide(session=None, sequence=None, angles_sequence=None, flux=None, codebook=None,
+                            **parametres) -> Callable[[float], float]:
+    """
+    Chemin de poussée le plus rapide parmi ceux fournis : séquence, FIFO, codebook puis synthèse.
+    :param parametres: freq_rf, distance_element, lmbda, ponderations, facteur_correction selon le chemin.
+    """
+    if sequence is not None and sequence.n_segments:
+        if angles_sequence is None and codebook is None:
+            raise ValueError("chemin séquence : angles_sequence ou codebook est requis pour connaître l'angle de "
+                             "chaque segment")
+        angles = angles_sequence if angles_sequence is not None else codebook.angles_radians
+        return PousseurSequence(sequence, angles)
+    if flux is not None and flux.actif:
+        return PousseurFifo(flux, parametres["distance_element"], parametres["lmbda"],
+                            len(parametres.get("ponderations", (1, 1, 1, 1))))
+    if codebook is not None:
+        return PousseurCodebook(session, codebook)
+    return PousseurSynthese(session, **parametres)
+
+
+class SuiviCible:
+    """
+    Boucle de suivi : lecture des mesures dans un thread, poussée des faisceaux prédits dans un autre.
+    """
+
+    def __init__(self, flux: Callable[[threading.Event], Iterator[str]], pousseur: Callable[[float], float],
+                 frequence_max: float = 50, zone_morte_degres: float = 0.2, predicteur: PredicteurAngle = None,
+                 historique: int = 1000) -> None:
+        """
+        :param flux: fonction donnant les lignes de mesures, appelée avec l'évènement d'arrêt (par exemple
+            functools.partial(flux_udp, 5005)).
+        :param pousseur: applique un angle (radians) sur la carte et renvoie l'angle effectivement appliqué.
+        :param frequence_max: nombre maximal de poussées par seconde.
+        :param zone_morte_degres: écart minimal avec le dernier angle poussé pour pousser à nouveau.
+        :param predicteur: filtre de prédiction (PredicteurAngle par défaut).
+        :param historique: nombre de poussées conservées pour les statistiques.
+        """
+        self.flux = flux
+        self.pousseur = pousseur
+        self.periode = 1 / frequence_max
+        self.zone_morte = np.deg2rad(zone_morte_degres)
+        self.predicteur = predicteur if predicteur is not None else PredicteurAngle()
+        self._verrou = threading.Lock()
+        self._arret = threading.Event()
+        self._threads = []
+        self.derniere_mesure = None  # (instant de réception, horodatage, angle en degrés)
+        self.angle_pousse = None
+        self.duree_poussee = 0.0  # durée moyenne d'une poussée, ajoutée à l'horizon de prédiction
+        self.mesures_recues = 0
+        self.erreur = None
+        self.poussees = deque(maxlen=historique)  # (instant de fin, latence ou None pour une extrapolation)
+
+    def demarrer(self) -> None:
+        self._arret.clear()
+        self._threads = [threading.Thread(target=self._lire, name="suivi mesures", daemon=True),
+                         threading.Thread(target=self._pousser, name="suivi poussées", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def arreter(self) -> None:
+        self._arret.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _lire(self) -> None:
+        for ligne in self.flux(self._arret):
+            mesure = lecture_mesure(ligne)
+            if mesure is None:
+                continue
+            horodatage, angle = mesure
+            maintenant = time.monotonic()
+            with self._verrou:
+                self.predicteur.mettre_a_jour(maintenant, np.deg2rad(angle))
+                self.derniere_mesure = (maintenant, horodatage, angle)
+                self.mesures_recues += 1
+
+    def _pousser(self) -> None:
+        prochaine = time.monotonic()
+        derniere_poussee = None
+        while not self._arret.is_set():
+            prochaine += self.periode
+            with self._verrou:
+                mesure = self.derniere_mesure
+                angle = self.predicteur.predire(time.monotonic() + self.duree_poussee)
+            if angle is not None and (self.angle_pousse is None or abs(angle - self.angle_pousse) >= self.zone_morte):
+                debut = time.monotonic()
+                try:
+                    self.angle_pousse = self.pousseur(angle)
+                except Exception as exception:
+                    self.erreur = exception
+                    break
+                fin = time.monotonic()
+                self.duree_poussee += 0.2 * ((fin - debut) - self.duree_poussee)
+                # latence comptée à la première poussée qui suit une nouvelle mesure, pas sur les extrapolations
+                latence = None
+                if mesure is not derniere_poussee:
+                    reception, horodatage, _ = mesure
+                    latence = time.time() - horodatage if horodatage is not None else fin - reception
+                    derniere_poussee = mesure
+                self.poussees.append((fin, latence))
+            self._arret.wait(max(prochaine - time.monotonic(), 0))
+            prochaine = max(prochaine, time.monotonic() - self.periode)
+
+    def statistiques(self) -> dict:
+        """
+        Fréquence de mise à jour (Hz) et latence de bout en bout (ms) sur les dernières poussées.
+        """
+        poussees = list(self.poussees)
+        statistiques = {"mesures": self.mesures_recues, "poussees": len(poussees),
+                        "duree_poussee_ms": self.duree_poussee * 1e3}
+        if len(poussees) >= 2:
+            instants = [instant for instant, _ in poussees]
+            statistiques["frequence_hz"] = (len(poussees) - 1) / max(instants[-1] - instants[0], 1e-9)
+        latences = [latence for _, latence in poussees if latence is not None]
+        if latences:
+            statistiques["latence_mediane_ms"] = float(np.median(latences) * 1e3)
+            statistiques["latence_p95_ms"] = float(np.percentile(latences, 95) * 1e3)
+        return statistiques
+
+
+def main(arguments=None):
+    from functools import partial
+    from netbox_api import CardSession
+    parser = argparse.ArgumentParser(description="suivi d'une cible à partir d'un flux d'angles")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--port", type=int, help="port UDP local recevant les angles")
+    source.add_argument("--fichier", help="fichier (ou tube, ou - pour l'entrée standard) d'angles")
+    parser.add_argument("--ip", default="169.254.114.9")
+    parser.add_argument("--codebook", help="dossier d'un codebook de faisceaux (construire_codebook)")
+    parser.add_argument("--freq-rf", type=float, default=75e6)
+    parser.add_argument("--distance", type=float, default=0.11, help="distance inter-éléments (m)")
+    parser.add_argument("--lmbda", type=float, default=3e8 / 3.578711e9, help="longueur d'onde (m)")
+    parser.add_argument("--frequence-max", type=float, default=50)
+    arguments = parser.parse_args(arguments)
+
+    flux = partial(flux_udp, arguments.port) if arguments.port else partial(flux_fichier, arguments.fichier)
+    with CardSession(arguments.ip, 0) as session:
+        session.configurer()
+        codebook = None
+        if arguments.codebook:
+            from codebook_faisceaux import CodebookFaisceaux
+            codebook = CodebookFaisceaux(arguments.codebook)
+        pousseur = pousseur_le_plus_rapide(session, codebook=codebook, freq_rf=arguments.freq_rf,
+                                           distance_element=arguments.distance, lmbda=arguments.lmbda)
+        suivi = SuiviCible(flux, pousseur, frequence_max=arguments.frequence_max)
+        suivi.demarrer()
+        try:
+            while True:
+                time.sleep(1)
+                print(suivi.statistiques())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            suivi.arreter()
+            session.arreter()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur de synthèse des signaux envoyés sur les voies de la netbox.
+
+Toutes les voies sont calculées en une seule passe vectorisée : la porteuse (cos et sin de 2*pi*f*t) est calculée une
+fois pour un couple (fréquence, taille de buffer) puis mise en cache. Modifier les phases ou les pondérations revient
+alors à un simple produit matriciel (N, 2) @ (2, échantillons), sans réévaluer de fonction trigonométrique.
+"""
+from functools import lru_cache
+from typing import Sequence
+
+import numpy as np
+
+FREQ_ECH = 1e9  # Hz
+TAILLE_BUFFER = 65536  # échantillons par voie
+AMPLITUDE_MAX = 32767  # pleine échelle d'un échantillon int16
+
+
+@lru_cache(maxsize=8)
+def base_temps(taille_buffer: int = TAILLE_BUFFER, freq_ech: float = FREQ_ECH) -> np.ndarray:
+    """
+    Renvoie l'échelle des temps partagée par toutes les voies. Le tableau est mis en cache et en lecture seule.
+    :param taille_buffer: nombre d'échantillons par voie.
+    :param freq_ech: fréquence d'échantillonnage (Hz).
+    :return: np.array
+    """
+    temps = np.arange(taille_buffer, dtype=np.float64) / freq_ech
+    temps.flags.writeable = False
+    return temps
+
+
+@lru_cache(maxsize=8)
+def porteuse(freq_signal: float, taille_buffer: int = TAILLE_BUFFER, freq_ech: float = FREQ_ECH) -> np.ndarray:
+    """
+    Renvoie la porteuse en quadrature [sin(wt), cos(wt)] de forme (2, taille_buffer). Le tableau est mis en cache et
+    en lecture seule.
+    :param freq_signal: fréquence du signal, facteur de correction déjà appliqué (Hz).
+    :param taille_buffer: nombre d'échantillons par voie.
+    :param freq_ech: fréquence d'échantillonnage (Hz).
+    :return: np.array
+    """
+    wt = 2 * np.pi * freq_signal * base_temps(taille_buffer, freq_ech)
+    quadrature = np.stack((np.sin(wt), np.cos(wt)))
+    quadrature.flags.writeable = False
+    return quadrature
+
+
+def coefficients_voies(ponderations: Sequence[float], phases_radians: Sequence[float]) -> np.ndarray:
+    """
+    Décompose chaque voie a*sin(wt + phi) en a*cos(phi)*sin(wt) + a*sin(phi)*cos(wt).
+    :param ponderations: pondération de chaque voie.
+    :param phases_radians: phase de chaque voie (radians).
+    :return: np.array de forme (N, 2)
+    """
+    ponderations = np.asarray(ponderations, dtype=np.float64)
+    phases_radians = np.asarray(phases_radians, dtype=np.float64)
+    if ponderations.shape != phases_radians.shape:
+        raise ValueError("autant de pondérations que de phases sont attendues")
+    return np.stack((ponderations * np.cos(phases_radians), ponderations * np.sin(phases_radians)), axis=-1)
+
+
+def synthese_voies(freq_signal: float, ponderations: Sequence[float], phases_radians: Sequence[float],
+                   facteur_correction: float = 1, taille_buffer: int = TAILLE_BUFFER,
+                   freq_ech: float = FREQ_ECH) -> np.ndarray:
+    """
+    Calcule les signaux normalisés à 1 de toutes les voies en une seule passe.
+    :param freq_signal: fréquence RF souhaitée (Hz).
+    :param ponderations: pondération de chaque voie.
+    :param phases_radians: phase de chaque voie (radians).
+    :param facteur_correction: rapport entre la fréquence d'échantillonnage théorique et celle de la netbox.
+    :param taille_buffer: nombre d'échantillons par voie.
+    :param freq_ech: fréquence d'échantillonnage (Hz).
+    :return: np.array de forme (N, taille_buffer)
+    """
+    return coefficients_voies(ponderations, phases_radians) @ porteuse(facteur_correction * freq_signal,
+                                                                       taille_buffer, freq_ech)
+
+
+def synthese_voies_int16(freq_signal: float, ponderations: Sequence[float], phases_radians: Sequence[float],
+                         facteur_correction: float = 1, taille_buffer: int = TAILLE_BUFFER, freq_ech: float = FREQ_ECH,
+                         amplitude_max: int = AMPLITUDE_MAX) -> np.ndarray:
+    """
+    Calcule les signaux numérisés de toutes les voies. La mise à l'échelle est faite sur les coefficients, si bien
+    que le produit matriciel donne directement les échantillons, qui sont ensuite écrêtés et arrondis.
+    :param amplitude_max: valeur numérique correspondant à une pondération de 1.
+    :return: np.array int16 de forme (N, taille_buffer)
+    """
+    coefficients = amplitude_max * coefficients_voies(ponderations, phases_radians)
+    signaux = coefficients @ porteuse(facteur_correction * freq_signal, taille_buffer, freq_ech)
+    return quantification(signaux)
+
+
+def synthese_entrelacee(destination: np.ndarray, freq_signal: float, ponderations: Sequence[float],
+                        phases_radians: Sequence[float], facteur_correction: float = 1, freq_ech: float = FREQ_ECH,
+                        amplitude_max: int = AMPLITUDE_MAX, echantillon_debut: int = 0,
+                        voies: Sequence[int] = None) -> np.ndarray:
+    """
+    Calcule les signaux numérisés et les écrit entrelacés (v0, v1, ..., vN-1, v0, ...) dans le buffer de destination,
+    typiquement une vue int16 sur le buffer DMA. L'écrêtage, l'arrondi et l'entrelacement se font en une seule
+    écriture vectorisée.
+    :param destination: tableau int16 à une dimension de taille N * échantillons.
+    :param echantillon_debut: indice du premier échantillon, pour prolonger sans discontinuité un signal déjà émis.
+    :param voies: indices des seules voies à recalculer, les échantillons des autres voies sont laissés tels quels
+        dans le buffer (toutes les voies si None).
+    :return: le tableau de destination.
+    """
+    n_voies = len(ponderations)
+    if destination.size % n_voies:
+        raise ValueError("la taille du buffer n'est pas un multiple du nombre de voies")
+    taille_buffer = destination.size // n_voies
+    freq_signal = facteur_correction * freq_signal
+    if echantillon_debut:
+        # avance de phase de la porteuse au premier échantillon, réduite modulo une période
+        phases_radians = np.asarray(phases_radians) + 2 * np.pi * ((freq_signal * echantillon_debut / freq_ech) % 1)
+    coefficients = amplitude_max * coefficients_voies(ponderations, phases_radians)
+    entrelace = destination.reshape(taille_buffer, n_voies)
+    if voies is not None:
+        # une colonne du buffer entrelacé par voie recalculée
+        voies = list(voies)
+        signaux = coefficients[voies] @ porteuse(freq_signal, taille_buffer, freq_ech)
+        for signal, voie in zip(signaux, voies):
+            quantification(signal, out=entrelace[:, voie])
+        return destination
+    signaux = coefficients @ porteuse(freq_signal, taille_buffer, freq_ech)
+    quantification(signaux, out=entrelace.T)
+    return destination
+
+
+def quantification(signaux: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    Écrête et arrondit des échantillons déjà mis à l'échelle vers des entiers 16 bits. Le tableau d'entrée est modifié
+    sur place.
+    :param signaux: échantillons flottants.
+    :param out: tableau int16 de destination (optionnel), éventuellement une vue non contiguë.
+    :return: np.array int16
+    """
+    info = np.iinfo(np.int16)
+    np.clip(signaux, info.min, info.max, out=signaux)
+    np.rint(signaux, out=signaux)
+    if out is None:
+        return signaux.astype(np.int16)
+    np.copyto(out, signaux, casting="unsafe")
+    return out
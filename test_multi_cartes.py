@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from multi_cartes import MultiCartes
+from netbox_api import MockBackend
+
+
+def test_en_parallele_attend_toutes_les_cartes_avant_de_lever():
+    cartes = MultiCartes([("a", 0), ("a", 1)], backend=MockBackend())
+    terminee = threading.Event()
+
+    def operation(session):
+        if session.card_number == 0:
+            raise ConnectionError("carte 0 perdue")
+        time.sleep(0.2)
+        terminee.set()
+
+    try:
+        with pytest.raises(ConnectionError, match="carte 0"):
+            cartes.en_parallele(operation)
+        # la carte lente a fini son opération avant que l'erreur ne parvienne à l'appelant
+        assert terminee.is_set()
+    finally:
+        cartes.executeur.shutdown(wait=True)
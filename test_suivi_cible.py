@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import time
+
+import numpy as np
+import pytest
+
+from codebook_faisceaux import construire_codebook
+from netbox_api import CardSession, MockBackend, M2CMD_CARD_START, SPC_M2CMD
+from suivi_cible import PousseurCodebook, PousseurSynthese, SuiviCible
+
+DISTANCE = 0.11
+LMBDA = 3e8 / 3.578711e9
+
+
+def flux_mesures(angles_degres, intervalle=0.05):
+    # une mesure toutes les `intervalle` secondes, puis attente de l'arrêt
+    def flux(arret):
+        for angle in angles_degres:
+            yield f"{angle}"
+            time.sleep(intervalle)
+        arret.wait()
+    return flux
+
+
+def demarrages(backend):
+    return sum(1 for appel in backend.appels
+               if appel[0] == "spcm_dwSetParam_i32" and appel[2] == SPC_M2CMD and appel[3] & M2CMD_CARD_START)
+
+
+@pytest.fixture(params=["synthese", "codebook"])
+def pousseur(request, tmp_path):
+    backend = MockBackend()
+    session = CardSession(backend=backend)
+    if request.param == "synthese":
+        pousseur = PousseurSynthese(session, 75e6, DISTANCE, LMBDA)
+    else:
+        codebook = construire_codebook(str(tmp_path), np.deg2rad(np.arange(-30, 31, 10)), DISTANCE, LMBDA, 75e6)
+        pousseur = PousseurCodebook(session, codebook)
+    yield pousseur, backend
+    session.fermer()
+
+
+def test_poussees_successives_sur_carte_en_marche(pousseur):
+    pousseur, backend = pousseur
+    for angle in np.deg2rad([-20, 0, 20]):
+        pousseur(angle)
+    assert demarrages(backend) == 3
+
+
+def test_suivi_pousse_toutes_les_mesures(pousseur):
+    pousseur, backend = pousseur
+    suivi = SuiviCible(flux_mesures([-30, -20, -10, 0, 10, 20]), pousseur, frequence_max=100)
+    suivi.demarrer()
+    time.sleep(0.5)
+    suivi.arreter()
+    assert suivi.erreur is None
+    assert suivi.mesures_recues == 6
+    assert len(suivi.poussees) >= 6
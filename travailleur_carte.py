@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Thread dédié aux opérations sur la carte, pour que la boucle Tk ne soit jamais bloquée par la netbox.
+
+Les opérations (configuration, transfert DMA, démarrage avec son SPC_TIMEOUT, arrêt...) sont déposées dans une file et
+exécutées une à une par le thread. Une opération soumise avec une clé remplace celle de même clé qui attend encore :
+une rafale de changements de paramètres ne donne qu'une mise à jour de la carte, avec les derniers paramètres. Les
+rappels de fin d'opération ne sont pas exécutés par le thread mais remis au thread Tk, qui les relève avec after().
+"""
+import itertools
+import queue
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class TravailleurCarte:
+    """
+    File d'opérations matérielles exécutées dans l'ordre par un thread dédié.
+    """
+
+    def __init__(self, nom: str = "travailleur carte") -> None:
+        """
+        :param nom: nom du thread.
+        """
+        self._condition = threading.Condition()
+        self._en_attente = OrderedDict()  # clé -> (opération, arguments, rappel)
+        self._numeros = itertools.count()
+        self._arret = False
+        self.resultats = queue.SimpleQueue()
+        self.operation_en_cours = None
+        self.operations_executees = 0
+        self.operations_fusionnees = 0
+        self._thread = threading.Thread(target=self._boucle, name=nom, daemon=True)
+        self._thread.start()
+
+    @property
+    def occupe(self) -> bool:
+        with self._condition:
+            return bool(self._en_attente) or self.operation_en_cours is not None
+
+    def soumettre(self, operation: Callable, *args, rappel: Callable = None, cle: Hashable = None) -> None:
+        """
+        Dépose une opération dans la file.
+        :param operation: fonction exécutée par le thread avec les arguments donnés.
+        :param rappel: appelé dans le thread Tk avec (résultat, exception ou None) une fois l'opération terminée.
+        :param cle: une opération de même clé qui n'a pas encore démarré est remplacée par celle-ci, à sa place dans
+            la file.
+        """
+        with self._condition:
+            if self._arret:
+                raise RuntimeError("le travailleur de la carte est arrêté")
+            if cle is None:
+                cle = ("operation", next(self._numeros))
+            elif cle in self._en_attente:
+                self.operations_fusionnees += 1
+            self._en_attente[cle] = (operation, args, rappel)
+            self._condition.notify()
+
+    def _boucle(self) -> None:
+        while True:
+            with self._condition:
+                while not self._en_attente and not self._arret:
+                    self._condition.wait()
+                if not self._en_attente:
+                    return
+                cle, (operation, args, rappel) = self._en_attente.popitem(last=False)
+                self.operation_en_cours = cle
+            try:
+                resultat, erreur = operation(*args), None
+            except Exception as exception:
+                resultat, erreur = None, exception
+                if rappel is None:
+                    traceback.print_exception(type(exception), exception, exception.__traceback__, file=sys.stderr)
+            with self._condition:
+                self.operation_en_cours = None
+                self.operations_executees += 1
+            if rappel is not None:
+                self.resultats.put((rappel, resultat, erreur))
+
+    def distribuer_resultats(self) -> None:
+        """
+        Exécute les rappels des opérations terminées. À appeler depuis le thread Tk, typiquement avec after().
+        """
+        while True:
+            try:
+                rappel, resultat, erreur = self.resultats.get_nowait()
+            except queue.Empty:
+                return
+            rappel(resultat, erreur)
+
+    def arreter(self, timeout: float = None) -> None:
+        """
+        Termine les opérations déjà soumises puis arrête le thread.
+        """
+        with self._condition:
+            self._arret = True
+            self._condition.notify()
+        self._thread.join(timeout)